@@ -1,6 +1,7 @@
 # app/routers/ai.py
 from __future__ import annotations
 
+import asyncio
 import json
 import os
 from pathlib import Path
@@ -9,12 +10,14 @@ from typing import Dict
 from fastapi import APIRouter, HTTPException, Request, Query, Form, Body
 from fastapi.responses import HTMLResponse, JSONResponse
 from collections import Counter
+from itertools import islice
 from urllib.parse import urlparse
 # === ikuti pola targets.py ===
 from ..deps import get_settings, get_templates
+from ..services import _json
 from ..services.ai_analyzer import run_ai_classification  # if routers and services are in same package adjust path: from ..services.ai_analyzer import ...
 from ..services.ai_rules import apply_rules, preview_rules
-from ..services.ai_apply import ApplyOptions
+from ..services.ai_apply import ApplyOptions, apply_rules as apply_rules_sources
 from ..services.ai_command import parse_prompt_to_plan, append_history, read_history
 #from ..services.ai_jobs import create_job, get_job_status
 #from app.routers import ai_commands as ai_commands_router  # NEW
@@ -116,7 +119,8 @@ async def ai_apply_rules(
         sample_limit=sample_limit,   # NOTE: this matches ApplyOptions.sample_limit
     )
 
-    result = apply_rules(outputs_root, scope, sources=sources, options=opts)
+    # CPU-bound (bisa pakai pool proses): jalankan di thread, jangan blok event loop
+    result = await asyncio.to_thread(apply_rules_sources, outputs_root, scope, sources=sources, options=opts)
     # If you want the page to reload (htmx), just return a tiny ok payload.
     return JSONResponse(result)
     
@@ -153,7 +157,7 @@ async def ai_run_llm(request: Request, scope: str, k: int = 500, batch: int = 30
 async def ai_apply_seed(request: Request, scope: str):
     settings = get_settings(request)
     outputs_root = Path(settings.OUTPUTS_DIR)
-    out = apply_rules(outputs_root, scope, save_result=True)
+    out = await asyncio.to_thread(apply_rules, outputs_root, scope, save_result=True)
     return JSONResponse(out)
 
 @router.get("/{scope}/ai/preview")
@@ -164,8 +168,8 @@ async def ai_preview(request: Request, scope: str, limit: int = 500,
     """
     settings = get_settings(request)
     outputs_root = Path(settings.OUTPUTS_DIR)
-    out = preview_rules(
-        outputs_root, scope,
+    out = await asyncio.to_thread(
+        preview_rules, outputs_root, scope,
         limit=max(1, min(limit, 2000)),
         demote_blocked=bool(demote_blocked),
         demote_404=bool(demote_404),
@@ -230,6 +234,29 @@ async def ai_overview(request: Request, scope: str):
     }
     return templates.TemplateResponse("ai_overview.html", ctx)
     
+def _iter_classify_rows(data: dict, cache_dir: Path):
+    """
+    Baris hasil klasifikasi dari ai_classify.json: `results` (format lama /
+    ai_analyzer), atau di-stream dari JSONL `results_file` (format 2 apply_rules),
+    fallback ke `results_sample`.
+    """
+    results = data.get("results")
+    if results:
+        yield from results
+        return
+    name = data.get("results_file")
+    rows_path = cache_dir / str(name or "")
+    if name and rows_path.is_file():
+        with rows_path.open("rb") as f:
+            for ln in f:
+                if ln.strip():
+                    try:
+                        yield _json.loads(ln)
+                    except ValueError:
+                        continue
+        return
+    yield from data.get("results_sample") or []
+
 @router.get("/{scope}/ai/insights", response_class=HTMLResponse)
 async def ai_dashboard(request: Request, scope: str):
     from app.core.config_store import load_settings
@@ -258,15 +285,14 @@ async def ai_dashboard(request: Request, scope: str):
 
     # --- load data ---
     ai_summary: dict = {}
-    raw_results: list[dict] = []
+    data: dict = {}
     if data_path.exists():
         try:
-            data = json.loads(data_path.read_text(encoding="utf-8"))
+            data = _json.loads(data_path.read_bytes())
             ai_summary = data.get("summary") or {}
-            raw_results = data.get("results") or data.get("results_sample") or []
         except Exception as e:
             ai_summary = {"note": f"Failed to parse ai_classify.json: {e}"}
-            raw_results = []
+            data = {}
 
     counts = ai_summary.get("counts") or {"HIGH": 0, "MEDIUM": 0, "LOW": 0, "INFO": 0}
     model  = ai_summary.get("model") or ai_summary.get("rules_version") or "-"
@@ -274,30 +300,40 @@ async def ai_dashboard(request: Request, scope: str):
 
     # --- filter by severity ---
     valid_sev = {"HIGH", "MEDIUM", "LOW", "INFO"}
-    if severity in valid_sev:
-        def pick_label(r: dict) -> str:
-            return (r.get("final_label") or r.get("label") or r.get("severity") or "-").upper()
-        filtered = [r for r in raw_results if pick_label(r) == severity]
-    else:
+    if severity not in valid_sev:
         severity = "ALL"
-        filtered = raw_results
 
-    # --- normalize for table ---
-    norm_rows: list[dict] = []
-    for r in filtered:
-        label  = (r.get("final_label") or r.get("label") or r.get("severity") or "-").upper()
-        reason = r.get("reason") or r.get("rule") or r.get("why") or "-"
-        url    = r.get("url") or r.get("open_url") or r.get("target") or "-"
-        norm_rows.append({"url": url, "label": label, "reason": reason})
+    def pick_label(r: dict) -> str:
+        return (r.get("final_label") or r.get("label") or r.get("severity") or "-").upper()
 
-    # --- paging ---
-    total        = len(norm_rows)
-    total_pages  = max(1, (total + page_size - 1) // page_size)
-    if page > total_pages: page = total_pages
+    def matching_rows():
+        for r in _iter_classify_rows(data, cache_dir):
+            if severity == "ALL" or pick_label(r) == severity:
+                yield r
+
+    # --- paging: stream baris, yang disimpan hanya isi halaman yang diminta ---
     if page < 1: page = 1
     start = (page - 1) * page_size
-    end   = start + page_size
-    page_rows = norm_rows[start:end]
+    total = 0
+    picked: list[dict] = []
+    for r in matching_rows():
+        if start <= total < start + page_size:
+            picked.append(r)
+        total += 1
+    total_pages  = max(1, (total + page_size - 1) // page_size)
+    if page > total_pages:
+        # halaman di luar jangkauan -> halaman terakhir (pass kedua, jarang terjadi)
+        page = total_pages
+        start = (page - 1) * page_size
+        picked = list(islice(matching_rows(), start, start + page_size))
+
+    # --- normalize for table ---
+    page_rows: list[dict] = []
+    for r in picked:
+        label  = pick_label(r)
+        reason = r.get("reason") or r.get("rule") or r.get("why") or "-"
+        url    = r.get("url") or r.get("open_url") or r.get("target") or "-"
+        page_rows.append({"url": url, "label": label, "reason": reason})
 
     ctx = {
         "request": request,
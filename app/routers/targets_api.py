@@ -1,7 +1,8 @@
 # app/routers/targets_api.py
 from __future__ import annotations
-import json, re, time
+import json, os, re, time
 from pathlib import Path
+from urllib.parse import urlparse
 from fastapi import APIRouter, Form, Request, Response
 from fastapi.responses import PlainTextResponse
 
@@ -9,6 +10,9 @@ from app.deps import get_settings
 
 router = APIRouter(prefix="/targets/api", tags=["targets-api"])
 
+# Subfolder minimal untuk target baru (NO legacy placeholders)
+TARGET_SUBDIRS = ("__cache", "__jobs__", "raw", "classified")
+
 # Regex domain sederhana (tanpa dep eksternal)
 DOMAIN_RE = re.compile(
     r"^(?=.{1,253}$)(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,}$"
@@ -17,8 +21,7 @@ DOMAIN_RE = re.compile(
 def normalize_scope(raw: str) -> str:
     v = (raw or "").strip().lower()
     # kalau user paste URL, ambil host-nya
-    if v.startswith("http://") or v.startswith("https://"):
-        from urllib.parse import urlparse
+    if v.startswith(("http://", "https://")):
         try:
             v = urlparse(v).hostname or v
         except Exception:
@@ -31,8 +34,6 @@ def normalize_scope(raw: str) -> str:
 
 @router.post("/add")
 def add_target(scope: str = Form(...), program: str = Form(None), request: Request = None):
-    from pathlib import Path
-    import json, time
     from app.services.programs import move_scope
 
     settings   = get_settings(request)
@@ -42,20 +43,18 @@ def add_target(scope: str = Form(...), program: str = Form(None), request: Reque
     if not DOMAIN_RE.match(scope_norm):
         return PlainTextResponse("Invalid domain format.", status_code=400)
 
-    base: Path   = settings.OUTPUTS_DIR
-    target_dir   = base / scope_norm
+    # string path + os.* langsung: tanpa konstruksi Path per subfolder
+    target_dir = os.path.join(str(settings.OUTPUTS_DIR), scope_norm)
 
-    if target_dir.exists():
+    if os.path.exists(target_dir):
         resp = PlainTextResponse("Target already exists.", status_code=200)
         resp.headers["HX-Redirect"] = f"/targets/{scope_norm}"
         return resp
 
     try:
-        # Struktur minimal (NO legacy placeholders)
-        (target_dir / "__cache").mkdir(parents=True, exist_ok=True)
-        (target_dir / "__jobs__").mkdir(parents=True, exist_ok=True)
-        (target_dir / "raw").mkdir(parents=True, exist_ok=True)
-        (target_dir / "classified").mkdir(parents=True, exist_ok=True)
+        # Struktur minimal (makedirs juga membuat target_dir sendiri)
+        for sub in TARGET_SUBDIRS:
+            os.makedirs(os.path.join(target_dir, sub), exist_ok=True)
 
         meta = {
             "scope": scope_norm,
@@ -64,10 +63,8 @@ def add_target(scope: str = Form(...), program: str = Form(None), request: Reque
             "notes": "",
             "last_scans": {},  # slot baru untuk timestamp tools
         }
-        (target_dir / "meta.json").write_text(
-            json.dumps(meta, ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
+        with open(os.path.join(target_dir, "meta.json"), "w", encoding="utf-8") as f:
+            f.write(json.dumps(meta, ensure_ascii=False, indent=2))
 
     except Exception as e:
         return PlainTextResponse(f"Failed to create target: {e}", status_code=500)
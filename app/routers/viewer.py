@@ -1,23 +1,35 @@
 from __future__ import annotations
 
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from urllib.parse import urlencode, urlparse, parse_qs, urlunparse
+from typing import Any, Iterator
+import hashlib
+import logging
+import math
+import os
+import threading
+from urllib.parse import urlencode, urlparse, urlunparse
 
-from fastapi import APIRouter, Query, Request
-from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse, RedirectResponse
+from fastapi import APIRouter, Query, Request, Response
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, RedirectResponse
 
 from app.deps import get_settings, get_templates
 from app.core.modules import MODULE_FILES  # mapping: module -> filename
-
-import json
-from datetime import datetime, timezone
+from app.services import _json
 
 router = APIRouter(prefix="/targets")
+log = logging.getLogger(__name__)
 
 
 # =========================
 # Canonicalization & lookup helpers
 # =========================
+@lru_cache(maxsize=65536)
 def _canon_url(u: str) -> str:
     """
     Canonicalize URL supaya cocok saat lookup index:
@@ -42,24 +54,47 @@ def _canon_url(u: str) -> str:
         return u.strip()
 
 
-def _lookup_enrich(idx: dict, url: str) -> dict:
-    """Coba beberapa varian URL agar match dengan index."""
-    if url in idx:
-        return idx[url]
-    cu = _canon_url(url)
-    if cu in idx:
-        return idx[cu]
+@lru_cache(maxsize=65536)
+def _swap_scheme(u: str) -> str:
+    """http:// <-> https:// (hasil di-cache, URL yang sama sering muncul lagi)."""
     try:
-        p = urlparse(url)
-        alt = url.replace("http://", "https://", 1) if p.scheme == "http" else url.replace("https://", "http://", 1)
-        if alt in idx:
-            return idx[alt]
-        calt = _canon_url(alt)
-        if calt in idx:
-            return idx[calt]
+        p = urlparse(u)
     except Exception:
-        pass
-    return {}
+        return u
+    if p.scheme == "http":
+        return u.replace("http://", "https://", 1)
+    return u.replace("https://", "http://", 1)
+
+
+def _lookup_enrich(idx: dict, url: str) -> dict:
+    """
+    Lookup enrich: varian http/https & canonical sudah dimasukkan ke index
+    saat build (_augment_index), jadi cukup raw lalu canonical.
+    """
+    return idx.get(url) or idx.get(_canon_url(url)) or {}
+
+
+def _add_variants(idx: dict, url: str, rec: dict, originals: set, prev: dict | None = None) -> None:
+    """
+    Daftarkan varian canonical + swap scheme (http<->https) untuk `url`.
+    Key URL asli (`originals`) tidak pernah ditimpa; varian yang masih menunjuk
+    record lama `url` (probe ulang, baris duplikat) ikut diganti ke record baru.
+    """
+    alt = _swap_scheme(url)
+    for v in (_canon_url(url), alt, _canon_url(alt)):
+        if v == url or v in originals:
+            continue
+        cur = idx.get(v)
+        if cur is None or (prev is not None and cur is prev):
+            idx[v] = rec
+
+
+def _augment_index(idx: dict) -> dict:
+    """Versi untuk index yang sudah jadi (dari service): satu pass di atas snapshot item."""
+    originals = set(idx)
+    for u, rec in list(idx.items()):
+        _add_variants(idx, u, rec, originals)
+    return idx
 
 
 def _iso_from_epoch(val):
@@ -72,9 +107,72 @@ def _iso_from_epoch(val):
 # =========================
 # Probe index loader (service-first, fallback reader)
 # =========================
+# key: str(outputs_dir/scope) -> (signature ndjson, index); LRU, tiap index bisa besar
+_PROBE_INDEX_CACHE: "OrderedDict[str, tuple[tuple, dict]]" = OrderedDict()
+_PROBE_INDEX_MAX = 8
+_PROBE_INDEX_PENDING: dict[str, Future] = {}
+_PROBE_INDEX_LOCK = threading.Lock()
+_INDEX_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="probe-index")
+
+
+def _file_sig(nd: Path) -> tuple:
+    try:
+        st = nd.stat()
+    except OSError:
+        return (None, None)
+    return (st.st_mtime_ns, st.st_size)
+
+
 def _load_probe_index(scope: str, outputs_dir) -> dict[str, dict]:
     """
-    Kembalikan index: url -> {code, status, size, ctype, title, ts}
+    Versi ter-cache dari _build_probe_index (invalidasi via mtime+size ndjson).
+    - cache hit: langsung kembalikan index
+    - cache basi: rebuild di background, sementara pakai index lama
+    - belum ada sama sekali: build sinkron (sekali saja)
+    """
+    key = str(outputs_dir / scope)
+    sig = _file_sig(outputs_dir / scope / "__cache" / "url_probe.ndjson")
+
+    with _PROBE_INDEX_LOCK:
+        cached = _PROBE_INDEX_CACHE.get(key)
+        if cached:
+            _PROBE_INDEX_CACHE.move_to_end(key)
+        if cached and cached[0] == sig:
+            return cached[1]
+        fut = _PROBE_INDEX_PENDING.get(key)
+        if fut is None:
+            fut = _INDEX_EXECUTOR.submit(_rebuild_probe_index, key, sig, scope, outputs_dir)
+            _PROBE_INDEX_PENDING[key] = fut
+
+    if cached:
+        return cached[1]
+    return fut.result()
+
+
+def _probe_index_is_current(scope: str, outputs_dir, sig: tuple) -> bool:
+    """True kalau index yang sedang di-cache dibangun dari ndjson dengan signature `sig`."""
+    with _PROBE_INDEX_LOCK:
+        cached = _PROBE_INDEX_CACHE.get(str(outputs_dir / scope))
+    return bool(cached) and cached[0] == sig
+
+
+def _rebuild_probe_index(key: str, sig: tuple, scope: str, outputs_dir) -> dict[str, dict]:
+    try:
+        idx = _build_probe_index(scope, outputs_dir)
+        with _PROBE_INDEX_LOCK:
+            _PROBE_INDEX_CACHE[key] = (sig, idx)
+            _PROBE_INDEX_CACHE.move_to_end(key)
+            while len(_PROBE_INDEX_CACHE) > _PROBE_INDEX_MAX:
+                _PROBE_INDEX_CACHE.popitem(last=False)
+        return idx
+    finally:
+        with _PROBE_INDEX_LOCK:
+            _PROBE_INDEX_PENDING.pop(key, None)
+
+
+def _build_probe_index(scope: str, outputs_dir) -> dict[str, dict]:
+    """
+    Kembalikan index: url -> {code, status, size, ctype, title, ts_epoch}
     Prioritas:
       1) pakai service/url_cache.py yang sudah ada (berbagai kemungkinan API umum)
       2) fallback: baca __cache/url_probe.ndjson langsung
@@ -89,13 +187,7 @@ def _load_probe_index(scope: str, outputs_dir) -> dict[str, dict]:
             idx = uc.url_probe_cache.get(scope, cache_dir)
             # tambahkan canonical view tanpa mengubah aslinya
             if isinstance(idx, dict) and idx:
-                extra = {}
-                for u, rec in idx.items():
-                    cu = _canon_url(u)
-                    if cu not in idx:
-                        extra[cu] = rec
-                if extra:
-                    idx.update(extra)
+                _augment_index(idx)
             return idx
 
         # b. fungsi langsung
@@ -103,13 +195,7 @@ def _load_probe_index(scope: str, outputs_dir) -> dict[str, dict]:
             if hasattr(uc, fname):
                 idx = getattr(uc, fname)(scope)
                 if isinstance(idx, dict) and idx:
-                    extra = {}
-                    for u, rec in idx.items():
-                        cu = _canon_url(u)
-                        if cu not in idx:
-                            extra[cu] = rec
-                    if extra:
-                        idx.update(extra)
+                    _augment_index(idx)
                 return idx
 
     except Exception:
@@ -117,99 +203,190 @@ def _load_probe_index(scope: str, outputs_dir) -> dict[str, dict]:
 
     # 2) fallback reader
     idx: dict[str, dict] = {}
+    originals: set[str] = set()
     nd = outputs_dir / scope / "__cache" / "url_probe.ndjson"
     if not nd.exists():
         return idx
 
-    with nd.open("r", encoding="utf-8", errors="ignore") as f:
+    for url, rec in _parse_probe_ndjson(nd):
+        # URL asli selalu menimpa; varian canonical (http/https, :80/:443)
+        # didaftarkan langsung di pass yang sama
+        prev = idx.get(url) if url in originals else None
+        originals.add(url)
+        idx[url] = rec
+        _add_variants(idx, url, rec, originals, prev)
+
+    return idx
+
+
+def _parse_probe_line(line: bytes) -> tuple[str, dict] | None:
+    """Satu baris NDJSON probe -> (url, {code, status, size, ctype, title, ts_epoch})."""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        rec = _json.loads(line)
+    except Exception:
+        return None
+
+    url = None
+    payload = None
+
+    # FORMAT A: {"url": "...", "status_code": 200, ...}
+    if isinstance(rec, dict) and "url" in rec:
+        url = rec.get("url")
+        payload = rec
+
+    # FORMAT B: {"http://host/path": { ...fields... }}
+    elif isinstance(rec, dict) and len(rec) == 1:
+        url, payload = next(iter(rec.items()))
+
+    if not url or not isinstance(payload, dict):
+        return None
+
+    code = payload.get("status_code")
+    if code is None:
+        code = payload.get("code")
+
+    # derive status (prioritas 'alive', fallback dari code)
+    alive = payload.get("alive")
+    if isinstance(alive, bool):
+        status = "up" if alive else "down"
+    elif isinstance(code, int):
+        if   200 <= code <= 299: status = "up"
+        elif 300 <= code <= 399: status = "redirect"
+        elif 400 <= code <= 499: status = "client"
+        elif 500 <= code <= 599: status = "server"
+        else: status = "other"
+    else:
+        status = "-"
+
+    # size & ctype
+    size  = payload.get("content_length")
+    if size is None:
+        size = payload.get("size")
+    ctype = payload.get("content_type") or payload.get("ctype")
+
+    # title
+    title = payload.get("title") or ""
+
+    # timestamp mentah; format ISO ditunda sampai baris benar-benar dirender
+    ts = payload.get("last_probe") or payload.get("@ts") or payload.get("ts") or payload.get("time")
+
+    return url, {
+        "code": code,
+        "status": status,
+        "size": size,
+        "ctype": ctype,
+        "title": title,
+        "ts_epoch": ts if isinstance(ts, (int, float, str)) else None,
+    }
+
+
+def _parse_probe_ndjson(nd: Path) -> Iterator[tuple[str, dict]]:
+    """
+    Iterasi (url, rec) sesuai urutan file. Parse di proses ini lewat shim orjson:
+    versi multi-proses (json stdlib + pickle tiap dict balik ke parent) lebih lambat.
+    """
+    with nd.open("rb") as f:
+        for line in f:
+            item = _parse_probe_line(line)
+            if item is not None:
+                yield item
+
+
+# =========================
+# Raw module file access
+# =========================
+def _iter_url_lines_raw(path: Path) -> Iterator[bytes]:
+    """
+    Iterasi baris non-kosong (sudah di-strip, masih bytes) dari file raw module.
+    Dibaca buffered biasa, bukan mmap: file ini bisa ditulis ulang/truncate oleh
+    tool yang sedang jalan, dan mmap yang masih dipegang bisa kena SIGBUS.
+    """
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return
+    with f:
         for line in f:
             line = line.strip()
-            if not line:
-                continue
-            try:
-                rec = json.loads(line)
-            except Exception:
-                continue
-
-            url = None
-            payload = None
-
-            # FORMAT A: {"url": "...", "status_code": 200, ...}
-            if isinstance(rec, dict) and "url" in rec:
-                url = rec.get("url")
-                payload = rec
-
-            # FORMAT B: {"http://host/path": { ...fields... }}
-            elif isinstance(rec, dict) and len(rec) == 1:
-                url, payload = next(iter(rec.items()))
-
-            if not url or not isinstance(payload, dict):
-                continue
-
-            code = payload.get("status_code")
-            if code is None:
-                code = payload.get("code")
-
-            # derive status (prioritas 'alive', fallback dari code)
-            alive = payload.get("alive")
-            if isinstance(alive, bool):
-                status = "up" if alive else "down"
-            elif isinstance(code, int):
-                if   200 <= code <= 299: status = "up"
-                elif 300 <= code <= 399: status = "redirect"
-                elif 400 <= code <= 499: status = "client"
-                elif 500 <= code <= 599: status = "server"
-                else: status = "other"
-            else:
-                status = "-"
-
-            # size & ctype
-            size  = payload.get("content_length")
-            if size is None:
-                size = payload.get("size")
-            ctype = payload.get("content_type") or payload.get("ctype")
-
-            # title
-            title = payload.get("title") or ""
-
-            # timestamp → ISO (timeago-friendly)
-            ts = payload.get("last_probe") or payload.get("@ts") or payload.get("ts") or payload.get("time")
-            iso_ts = _iso_from_epoch(ts) if isinstance(ts, (int, float, str)) else None
-
-            idx[url] = {
-                "code": code,
-                "status": status,
-                "size": size,
-                "ctype": ctype,
-                "title": title,
-                "ts": iso_ts or "-",   # kosongkan kalau gagal parse
-            }
-
-    # tambahkan index canonical (http/https, :80/:443)
-    extra = {}
-    for u, rec in idx.items():
-        cu = _canon_url(u)
-        if cu not in idx:
-            extra[cu] = rec
-    if extra:
-        idx.update(extra)
-    return idx
+            if line:
+                yield line
+
+
+def _iter_url_lines(path: Path) -> Iterator[str]:
+    """Seperti _iter_url_lines_raw tapi sudah di-decode ke str."""
+    for line in _iter_url_lines_raw(path):
+        yield line.decode("utf-8", "ignore")
+
+
+@lru_cache(maxsize=64)
+def _count_url_lines_cached(path_str: str, mtime_ns: int, size: int) -> int:
+    return sum(1 for _ in _iter_url_lines_raw(Path(path_str)))
+
+
+def _count_url_lines(path: Path) -> int:
+    """Jumlah baris non-kosong, di-cache per (path, mtime, size)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 0
+    return _count_url_lines_cached(str(path), st.st_mtime_ns, st.st_size)
+
+
+# =========================
+# Row model (tabel module_page)
+# =========================
+@dataclass(slots=True)
+class Row:
+    """Satu baris tabel module; Jinja akses via atribut (r.url, r.code, ...)."""
+    url: str
+    status: str
+    code: Any
+    size: str
+    title: str
+    last_probe: str
+    param_hit: Any
+    has_query: bool
+    scheme: str
+
+
+def _make_row(url: str, enr: dict, scheme: str | None) -> Row:
+    code = enr.get("code")
+    size_val = enr.get("size")
+    return Row(
+        url=url,
+        status=enr.get("status") or "-",
+        code=code if code is not None else "-",
+        size=_humansize(size_val) if size_val is not None else "-",
+        title=enr.get("title") or "-",
+        last_probe=enr.get("ts") or _iso_from_epoch(enr.get("ts_epoch")) or "-",
+        param_hit=None,
+        has_query="?" in url,
+        scheme=scheme or "",
+    )
 
 
 # =========================
 # Misc helpers
 # =========================
+_SIZE_UNITS = ("B", "KB", "MB", "GB", "TB")
+
+
 def _humansize(n):
     try:
         n = float(n)
     except Exception:
         return "-"
-    units = ["B", "KB", "MB", "GB", "TB"]
-    i = 0
-    while n >= 1024 and i < len(units) - 1:
-        n /= 1024.0
-        i += 1
-    return f"{n:.0f} {units[i]}" if i == 0 else f"{n:.1f} {units[i]}"
+    if not math.isfinite(n):
+        # int(inf/nan) raise; hasil sama dgn versi loop lama ("inf TB", "nan B")
+        return f"{n:.1f} {_SIZE_UNITS[-1]}" if n > 0 else f"{n:.0f} B"
+    if n < 1024:
+        return f"{n:.0f} B"
+    # index unit langsung dari bit_length (tiap unit = 10 bit)
+    i = min(len(_SIZE_UNITS) - 1, (int(n).bit_length() - 1) // 10)
+    return f"{n / (1 << (10 * i)):.1f} {_SIZE_UNITS[i]}"
 
 
 def _parse_codes(codes: str | None) -> set[int]:
@@ -227,21 +404,123 @@ def _parse_codes(codes: str | None) -> set[int]:
     return s
 
 
-def _match_http_class(code: int | None, klass: str | None) -> bool:
-    if not klass or klass in ("", "any", "(any)"):
-        return True
-    if code is None:
+def _basic_needles(q: str | None, host: str | None, param: str | None) -> tuple[str, ...]:
+    """Substring yang wajib ada di URL (q, host, 'param='); filter kosong di-skip."""
+    needles = []
+    if q:
+        needles.append(q)
+    if host:
+        needles.append(host)
+    if param:
+        needles.append(f"{param}=")
+    return tuple(needles)
+
+
+def _encode_needles(needles: tuple[str, ...]) -> tuple[bytes, ...]:
+    return tuple(n.encode("utf-8") for n in needles)
+
+
+def _iter_filtered(path: Path, needles: tuple[bytes, ...], probe_idx: dict, row_ok) -> Iterator[tuple[str, dict]]:
+    """
+    (url, enrich) yang lolos filter, lazy sesuai urutan file. Substring dicek di
+    bytes; hanya baris yang lolos yang di-decode & di-lookup enrich-nya.
+    """
+    for raw in _iter_url_lines_raw(path):
+        if needles and not all(n in raw for n in needles):
+            continue
+        url = raw.decode("utf-8", "ignore")
+        enr = _lookup_enrich(probe_idx, url)
+        if row_ok is not None and not row_ok(url, enr):
+            continue
+        yield url, enr
+
+
+# total hasil filter per (file, probe, filter); halaman berikutnya cukup scan
+# sampai offset+limit match
+_FILTERED_TOTALS: "OrderedDict[tuple, int]" = OrderedDict()
+_FILTERED_TOTALS_MAX = 128
+
+
+def _remember_filtered_total(key: tuple, total: int) -> None:
+    _FILTERED_TOTALS[key] = total
+    while len(_FILTERED_TOTALS) > _FILTERED_TOTALS_MAX:
+        try:
+            _FILTERED_TOTALS.popitem(last=False)
+        except KeyError:
+            break
+
+
+_CLASS_MAP = {"2xx": 2, "3xx": 3, "4xx": 4, "5xx": 5}
+
+
+def _http_class_want(klass: str | None) -> int | None:
+    """'2xx' -> 2, dst; None kalau kosong/any/tidak dikenal (= tanpa filter)."""
+    return _CLASS_MAP.get((klass or "").lower())
+
+
+def _build_row_filter(
+    *,
+    codes_set: set[int],
+    http_class: str | None,
+    ctype_q: str,
+    min_b: int | None,
+    max_b: int | None,
+    scheme: str | None,
+):
+    """
+    Rakit predicate (url, enr) -> bool yang HANYA berisi filter lanjutan yang aktif,
+    supaya loop per baris tidak mengevaluasi cabang filter kosong.
+    Return None kalau tidak ada filter aktif.
+    """
+    checks = []
+
+    if codes_set:
+        checks.append(lambda url, enr: enr.get("code") in codes_set)
+
+    want = _http_class_want(http_class)
+    if want is not None:
+        def _klass(url, enr):
+            code = enr.get("code")
+            return isinstance(code, int) and code // 100 == want
+        checks.append(_klass)
+
+    if ctype_q:
+        checks.append(lambda url, enr: ctype_q in (enr.get("ctype") or "").lower())
+
+    if min_b is not None:
+        def _min(url, enr):
+            v = enr.get("size")
+            return isinstance(v, (int, float)) and v >= min_b
+        checks.append(_min)
+
+    if max_b is not None:
+        def _max(url, enr):
+            v = enr.get("size")
+            return isinstance(v, (int, float)) and v <= max_b
+        checks.append(_max)
+
+    if scheme == "http":
+        checks.append(lambda url, enr: url.startswith("http://"))
+    elif scheme == "https":
+        checks.append(lambda url, enr: url.startswith("https://"))
+
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+    return lambda url, enr: all(c(url, enr) for c in checks)
+
+
+def _etag_for(*parts) -> str:
+    raw = "|".join(str(p) for p in parts).encode("utf-8", "ignore")
+    return '"' + hashlib.blake2b(raw, digest_size=16).hexdigest() + '"'
+
+
+def _etag_matches(request: Request | None, etag: str) -> bool:
+    inm = request.headers.get("if-none-match") if request is not None else None
+    if not inm:
         return False
-    k = klass.lower()
-    if k == "2xx":
-        return 200 <= code <= 299
-    if k == "3xx":
-        return 300 <= code <= 399
-    if k == "4xx":
-        return 400 <= code <= 499
-    if k == "5xx":
-        return 500 <= code <= 599
-    return True
+    return any(t.strip().removeprefix("W/") == etag for t in inm.split(","))
 
 
 def _build_qs_preserve(request: Request, *, pages: int, limit: int, page: int):
@@ -249,13 +528,8 @@ def _build_qs_preserve(request: Request, *, pages: int, limit: int, page: int):
     Build helpers that ALWAYS preserve current filters from request.query_params,
     only replacing the 'page' (and normalizing page_size).
     """
-    # Take the current query params as dict[str, str]
+    # Take the current query params as dict[str, str] (dict() keeps last occurrence)
     current_qs = dict(request.query_params.multi_items())
-    # Remove duplicates by keeping last occurrence
-    tmp = {}
-    for k, v in current_qs.items():
-        tmp[k] = v
-    current_qs = tmp
 
     # Normalize keys we control
     current_qs.pop("offset", None)          # not used anymore
@@ -305,7 +579,8 @@ def list_module(
     param: str | None = None,
     offset: int = 0,
     limit: int = Query(50, le=1000),
-    request: Request = None,  # tidak dipakai di sini, biar konsisten signature
+    request: Request = None,
+    response: Response = None,
 ):
     settings = get_settings(request)
     filename = MODULE_FILES.get(module.upper())
@@ -313,28 +588,26 @@ def list_module(
         return {"total": 0, "items": []}
 
     path = settings.OUTPUTS_DIR / scope / filename
+    etag = _etag_for("list", scope, module, request.url.query, _file_sig(path))
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
     # versi list.json tetap minimal (tanpa enrich) biar ringan
+    # filter langsung di bytes; decode hanya baris yang masuk halaman
+    needles = _encode_needles(_basic_needles(q, host, param))
     total, items = 0, []
-    if path.exists():
-        with path.open("r", encoding="utf-8", errors="ignore") as f:
-            for line in f:
-                url = line.strip()
-                if not url:
-                    continue
-                if q and q not in url:
-                    continue
-                if host and host not in url:
-                    continue
-                if param and (f"{param}=" not in url):
-                    continue
-                if total >= offset and len(items) < limit:
-                    items.append(url)
-                total += 1
+    for raw in _iter_url_lines_raw(path):
+        if needles and not all(n in raw for n in needles):
+            continue
+        if total >= offset and len(items) < limit:
+            items.append(raw.decode("utf-8", "ignore"))
+        total += 1
     return {"total": total, "items": items}
 
 
 @router.get("/{scope}/module/{module}/download")
-def download_module(scope: str, module: str, request: Request):
+async def download_module(scope: str, module: str, request: Request):
     settings = get_settings(request)
     filename = MODULE_FILES.get(module.upper())
     if not filename:
@@ -343,13 +616,10 @@ def download_module(scope: str, module: str, request: Request):
     if not path.exists():
         return PlainTextResponse("Not found", status_code=404)
 
-    def iterfile():
-        with path.open("rb") as f:
-            while chunk := f.read(1024 * 1024):
-                yield chunk
-
+    # FileResponse membaca file secara async (anyio) per chunk, tanpa
+    # generator sinkron yang memblok event loop
     headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
-    return StreamingResponse(iterfile(), media_type="text/plain", headers=headers)
+    return FileResponse(path, media_type="text/plain", headers=headers)
 
 
 @router.get("/{scope}/module/{module}", response_class=HTMLResponse)
@@ -396,10 +666,17 @@ def module_page(
     filename = MODULE_FILES.get(module.upper())
     path = settings.OUTPUTS_DIR / scope / (filename or "")
 
+    # revalidasi: halaman = fungsi murni dari (filter, raw file, ndjson probe)
+    probe_sig = _file_sig(settings.OUTPUTS_DIR / scope / "__cache" / "url_probe.ndjson")
+    etag = _etag_for("page", scope, module, request.url.query, _file_sig(path), probe_sig)
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
     # index enrich
     probe_idx = _load_probe_index(scope, settings.OUTPUTS_DIR)
-    # sanity log (opsional)
-    # print(f"[enrich] scope={scope} idx_size={len(probe_idx)}", flush=True)
+    # index lama (rebuild masih jalan di background) -> jangan kasih ETag
+    index_fresh = _probe_index_is_current(scope, settings.OUTPUTS_DIR, probe_sig)
+    log.debug("enrich scope=%s idx_size=%d", scope, len(probe_idx))
 
     # parse filter lanjutan
     codes_set = _parse_codes(codes)
@@ -415,58 +692,43 @@ def module_page(
 
     total, rows = 0, []
     if path.exists():
-        with path.open("r", encoding="utf-8", errors="ignore") as f:
-            for line in f:
-                url = line.strip()
-                if not url:
-                    continue
-
-                # basic filters
-                if q and q not in url:
-                    continue
-                if host and host not in url:
-                    continue
-                if param and (f"{param}=" not in url):
-                    continue
-
-                # enrich lookup (pakai helper robust)
-                enr = _lookup_enrich(probe_idx, url)
-                code = enr.get("code")
-                ctype_val = (enr.get("ctype") or "").lower()
-                size_val = enr.get("size")
-
-                # advanced filters
-                if codes_set and (code not in codes_set):
-                    continue
-                if not _match_http_class(code if isinstance(code, int) else None, http_class):
-                    continue
-                if ctype_q and (ctype_q not in ctype_val):
-                    continue
-                if min_b is not None and not (isinstance(size_val, (int, float)) and size_val >= min_b):
-                    continue
-                if max_b is not None and not (isinstance(size_val, (int, float)) and size_val <= max_b):
-                    continue
-                if scheme and scheme not in ("", "(any)", "any"):
-                    if scheme == "http" and not url.startswith("http://"):
-                        continue
-                    if scheme == "https" and not url.startswith("https://"):
-                        continue
-                # paginate
-                if total >= offset and len(rows) < limit:
-                    rows.append({
-                        "url": url,
-                        "status": enr.get("status") or "-",
-                        "code": code if code is not None else "-",
-                        "size": _humansize(size_val) if size_val is not None else "-",
-                        "title": enr.get("title") or "-",
-                        "last_probe": enr.get("ts") or "-",
-                        "param_hit": None,
-                        "has_query": "?" in url,
-                        "scheme": scheme or "",
-                    })
-                total += 1
-    else:
-        total, rows = 0, []
+        needles = _basic_needles(q, host, param)
+        row_ok = _build_row_filter(
+            codes_set=codes_set, http_class=http_class, ctype_q=ctype_q,
+            min_b=min_b, max_b=max_b, scheme=scheme,
+        )
+
+        if not needles and row_ok is None:
+            # tanpa filter: total dari line-count ter-cache (mtime), dan scan
+            # cukup sampai halaman yang diminta terisi
+            total = _count_url_lines(path)
+            for url in islice(_iter_url_lines(path), offset, offset + limit):
+                rows.append(_make_row(url, _lookup_enrich(probe_idx, url), scheme))
+        else:
+            needles_b = _encode_needles(needles)
+            matches = _iter_filtered(path, needles_b, probe_idx, row_ok)
+            # hasil filter lanjutan bergantung ke index probe; substring saja tidak
+            key = (
+                str(path), _file_sig(path), needles_b,
+                probe_sig if row_ok is not None else None,
+                tuple(sorted(codes_set)), _http_class_want(http_class), ctype_q,
+                min_b, max_b, scheme,
+            )
+            cached_total = _FILTERED_TOTALS.get(key)
+            if cached_total is not None:
+                # total sudah diketahui: berhenti begitu halaman terisi
+                total = cached_total
+                for url, enr in islice(matches, offset, offset + limit):
+                    rows.append(_make_row(url, enr, scheme))
+            else:
+                # pass pertama: hitung total sambil ambil halaman
+                for url, enr in matches:
+                    if offset <= total < offset + limit:
+                        rows.append(_make_row(url, enr, scheme))
+                    total += 1
+                # index lama -> total bisa beda setelah rebuild, jangan di-cache
+                if row_ok is None or index_fresh:
+                    _remember_filtered_total(key, total)
 
     # ---- compute pages window ----
     pages = max((total + limit - 1) // limit, 1)
@@ -480,7 +742,7 @@ def module_page(
     qs_for_page, qs_prev, qs_next, apply_qs, reset_qs = _build_qs_preserve(
         request, pages=pages, limit=limit, page=page
     )
-    print(f"[pager] query: page={page} page_size={limit} raw_qs={str(request.query_params)}", flush=True)
+    log.debug("pager query page=%s page_size=%s qs=%s", page, limit, request.query_params)
     ctx = {
         "request": request,
         "scope": scope,
@@ -530,19 +792,30 @@ def module_page(
         "scheme": scheme or "",
     }
 
-    return templates.TemplateResponse("module_generic.html", ctx)
+    resp = templates.TemplateResponse("module_generic.html", ctx)
+    if index_fresh:
+        resp.headers["ETag"] = etag
+    return resp
 
 
 @router.get("/{scope}/module/{module}/api/debug-index.json")
-def debug_index(scope: str, module: str, request: Request):
+def debug_index(scope: str, module: str, request: Request, response: Response):
     settings = get_settings(request)
+    nd = settings.OUTPUTS_DIR / scope / "__cache" / "url_probe.ndjson"
+    probe_sig = _file_sig(nd)
+    etag = _etag_for("debug-index", scope, probe_sig)
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
     idx = _load_probe_index(scope, settings.OUTPUTS_DIR)
+    if _probe_index_is_current(scope, settings.OUTPUTS_DIR, probe_sig):
+        response.headers["ETag"] = etag
     sample_keys = list(idx.keys())[:5]
     return {
         "scope": scope,
         "index_size": len(idx),
         "sample_keys": sample_keys,
-        "ndjson_path": str(settings.OUTPUTS_DIR / scope / "__cache" / "url_probe.ndjson"),
+        "ndjson_path": str(nd),
     }
 
 @router.get("/{scope}/sensitive_paths")
@@ -0,0 +1,66 @@
+# app/services/_json.py
+"""
+Shim JSON kecil: pakai orjson kalau terpasang (lebih cepat, langsung bytes),
+fallback ke stdlib json supaya tetap jalan tanpa dependency tambahan.
+"""
+from __future__ import annotations
+import json, mmap, os
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - tergantung environment
+    orjson = None
+
+JSONDecodeError = ValueError  # orjson.JSONDecodeError & json.JSONDecodeError sama2 subclass ValueError
+
+
+def loads(data: bytes | bytearray | memoryview | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def dumps(obj: Any, *, indent: bool = False) -> bytes:
+    """Serialize ke UTF-8 bytes (non-ASCII tidak di-escape, setara ensure_ascii=False)."""
+    if orjson is not None:
+        opt = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            return orjson.dumps(obj, option=opt)
+        except TypeError:
+            pass  # tipe yang tidak didukung orjson (mis. int > 64-bit) -> stdlib
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None).encode("utf-8")
+
+
+# di atas ukuran ini file di-parse langsung dari mmap (tanpa salinan bytes penuh)
+MMAP_MIN_BYTES = 256 * 1024
+
+
+def load_file(path: str | os.PathLike) -> Any:
+    """Baca & parse file JSON; file besar di-mmap lalu diumpankan langsung ke parser."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if orjson is None or size < MMAP_MIN_BYTES:
+            return loads(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as mv:
+            return orjson.loads(mv)
+
+
+def write_bytes(path: str | os.PathLike, data: bytes, *, fsync: bool = False) -> None:
+    """Tulis bytes secara atomik: tulis ke file .tmp lalu rename, jadi pembaca tidak pernah
+    melihat file setengah jadi. `fsync=True` untuk output final yang harus tahan crash."""
+    path = os.fspath(path)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def write_file(path: str | os.PathLike, obj: Any, *, indent: bool = False, fsync: bool = False) -> None:
+    """Serialize lalu tulis atomik (lihat write_bytes)."""
+    write_bytes(path, dumps(obj, indent=indent), fsync=fsync)
@@ -0,0 +1,66 @@
+# app/services/_procpool.py
+"""
+Pool proses bersama untuk kerja CPU-bound (klasifikasi rules korpus besar).
+Satu pool per proses server, dibuat lazy dengan start method forkserver/spawn:
+fork dari server uvicorn yang multithread bisa mewarisi lock yang sedang dipegang
+thread lain (deadlock di child).
+"""
+from __future__ import annotations
+import atexit, multiprocessing, os, threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_LOCK = threading.Lock()
+
+
+def max_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def _context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def shared_pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(max_workers=max_workers(), mp_context=_context())
+            atexit.register(_POOL.shutdown, wait=False, cancel_futures=True)
+        return _POOL
+
+
+def _discard(pool: ProcessPoolExecutor) -> None:
+    global _POOL
+    with _LOCK:
+        if _POOL is pool:
+            _POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def map_ordered(fn: Callable[..., Any], jobs: Iterable[Tuple[Any, ...]]) -> Iterator[Any]:
+    """
+    Jalankan fn(*args) untuk tiap job di pool bersama; hasil di-yield sesuai urutan
+    job. Window submit dibatasi (2x worker) supaya hasil tidak menumpuk di memori.
+    Pool yang rusak (worker mati) dibuang, panggilan berikutnya membuat yang baru.
+    """
+    pool = shared_pool()
+    window = max_workers() * 2
+    pending: deque = deque()
+    try:
+        for args in jobs:
+            pending.append(pool.submit(fn, *args))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    except BrokenProcessPool:
+        _discard(pool)
+        raise
+    finally:
+        for fut in pending:
+            fut.cancel()
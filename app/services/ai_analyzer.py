@@ -1,24 +1,36 @@
 # app/services/ai_analyzer.py
 from __future__ import annotations
-import os, json, random
+import os, random, re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Tuple
+from . import _json
 from .ai_client import AIClient
+from .enrich_urls import dedupe_urls
+
+try:
+    import json5  # parser toleran (trailing comma, single quote, key tanpa kutip)
+except ImportError:  # pragma: no cover - dependency opsional
+    json5 = None
 
 SUSPICIOUS_HINTS = ("/admin","/login","/debug","/config",".git",".env",".sql",".zip",".bak")
 
+_CODE_FENCE_RE = re.compile(r"```[\s\S]*?```")
+
 def _load_json(p: Path) -> dict:
     try:
-        return json.loads(p.read_text(encoding="utf-8")) if p.exists() else {}
+        return _json.load_file(p) if p.exists() else {}
     except Exception:
         return {}
 
 def _save_json_atomic(p: Path, data: dict) -> None:
     p.parent.mkdir(parents=True, exist_ok=True)
     tmp = p.with_suffix(p.suffix + ".tmp")
-    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.write_bytes(_json.dumps(data, indent=True))
     tmp.replace(p)
 
+@lru_cache(maxsize=100_000)
 def _score(url: str) -> int:
     s = url.lower()
     return sum(h in s for h in SUSPICIOUS_HINTS)
@@ -32,6 +44,93 @@ def sample_urls(url_map: Dict[str, dict], max_items: int = 40) -> List[Tuple[str
         return head + tail[:60]
     return items
 
+def _scan_json_objects(s: str):
+    """
+    Scan linear untuk fragmen {...} di teks bebas: lacak kedalaman kurung dan
+    status string/escape, lalu validasi dengan json.loads hanya saat sebuah objek
+    tertutup. Objek dalam (nested) ikut di-yield sebelum objek luarnya.
+    """
+    starts: List[int] = []
+    in_str = esc = False
+    for i, ch in enumerate(s):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            if starts:
+                in_str = True
+        elif ch == "{":
+            starts.append(i)
+        elif ch == "}" and starts:
+            start = starts.pop()
+            try:
+                obj = _json.loads(s[start:i + 1])
+            except Exception:
+                continue
+            if isinstance(obj, dict):
+                yield obj
+
+def _iter_json_objects(text: str):
+    if not text:
+        return
+    s = text.strip()
+    # array penuh
+    if s.startswith("[") and s.endswith("]"):
+        try:
+            arr = _json.loads(s)
+        except Exception:
+            arr = None
+            # JSON "hampir valid" khas LLM: coba json5 sebelum scan per fragmen
+            if json5 is not None:
+                try:
+                    arr = json5.loads(s)
+                except Exception:
+                    pass
+        if isinstance(arr, list):
+            for obj in arr:
+                if isinstance(obj, dict):
+                    yield obj
+            return
+    # hapus code fences
+    s = _CODE_FENCE_RE.sub("", s)
+    # cari semua {...} (brace matching satu pass, bukan regex)
+    yield from _scan_json_objects(s)
+
+def _parse_llm_output(raw: str) -> List[dict]:
+    """Parsing toleran: array/objek JSON dulu, fallback pola "url=..., label=..."."""
+    results = []
+    for obj in _iter_json_objects(raw or ""):
+        url    = obj.get("url")
+        label  = (obj.get("label") or "INFO").upper()
+        reason = obj.get("reason") or ""
+        if url:
+            if label not in ("HIGH","MEDIUM","LOW","INFO"):
+                label = "INFO"
+            results.append({"url": url, "label": label, "reason": reason})
+
+    if not results:
+        # fallback pola "url=..., label=HIGH, reason=..."
+        for line in (raw or "").splitlines():
+            line = line.strip()
+            if "url=" in line and ("label=" in line or "risk=" in line):
+                parts = {}
+                for kv in line.replace(",", " ").split():
+                    if "=" in kv:
+                        k, v = kv.split("=", 1)
+                        parts[k.strip().lower()] = v.strip()
+                url = parts.get("url")
+                lab = (parts.get("label") or parts.get("risk") or "INFO").upper()
+                rea = parts.get("reason") or ""
+                if url:
+                    if lab not in ("HIGH","MEDIUM","LOW","INFO"):
+                        lab = "INFO"
+                    results.append({"url": url, "label": lab, "reason": rea})
+    return results
+
 PROMPT = """
 You are a security assistant.
 
@@ -50,15 +149,29 @@ DATA (one per line):
 {block}
 """.strip()
 
+# template dipecah sekali saat import: render cukup concat, tanpa scan marker
+_PROMPT_HEAD, _PROMPT_TAIL = PROMPT.split("{block}", 1)
+
+def _render_prompt(block: str) -> str:
+    return f"{_PROMPT_HEAD}{block}{_PROMPT_TAIL}"
+
+# ukuran batch per prompt & jumlah request LLM yang jalan bersamaan
+_BATCH_SIZE = 40
+
+def _env_concurrency(default: int = 4) -> int:
+    # nilai env yang rusak tidak boleh menjatuhkan import modul (dan seluruh app)
+    try:
+        n = int(os.environ.get("AI_CONCURRENCY") or default)
+    except ValueError:
+        n = default
+    return max(1, n)
+
+_MAX_CONCURRENCY = _env_concurrency()
+_DEBUG_SEP = "\n\n===== batch =====\n\n"
+
 def _build_block(pairs: List[Tuple[str, dict]]) -> str:
-    return "\n".join(f"- {url}" for url, _ in pairs)
-    lines = []
-    for url, rec in pairs:
-        code = rec.get("code")
-        ctype = rec.get("content_type")
-        size = rec.get("size")
-        lines.append(f"- url={url} code={code} ctype={ctype} size={size}")
-    return "\n".join(lines)
+    urls = [url for url, _ in pairs]
+    return "- " + "\n- ".join(urls) if urls else ""
 
 def run_ai_classification(outputs_root: Path, scope: str, model_hint: str | None = None) -> dict:
     cache = outputs_root / scope / "__cache"
@@ -83,9 +196,9 @@ def run_ai_classification(outputs_root: Path, scope: str, model_hint: str | None
         try:
             if urls_txt.exists():
                 lines = [ln.strip() for ln in urls_txt.read_text(encoding="utf-8", errors="ignore").splitlines() if ln.strip()]
-                # ambil max 120
-                lines = lines[:120]
-                url_map = {u: {} for u in lines}
+                # buang duplikat dulu, lalu ambil max 120
+                lines = dedupe_urls(lines)[:120]
+                url_map = dict.fromkeys(lines, {})
         except Exception as e:
             (debug_dir / "fallback_error.txt").write_text(str(e), encoding="utf-8")
 
@@ -105,75 +218,25 @@ def run_ai_classification(outputs_root: Path, scope: str, model_hint: str | None
         return out
 
     pairs = sample_urls(url_map, max_items=120)
-    block = _build_block(pairs)
-    prompt = PROMPT.replace("{block}", block)
+    # pecah jadi beberapa prompt kecil yang dikirim paralel ke LLM
+    prompts = [_render_prompt(_build_block(pairs[i:i + _BATCH_SIZE]))
+               for i in range(0, len(pairs), _BATCH_SIZE)]
 
     if model_hint:
         os.environ["AI_MODEL"] = model_hint
 
-    client = AIClient()
-    raw = client.generate(prompt, temperature=0.1, max_tokens=1500)
+    client = AIClient(cache_dir=outputs_root / "__ai_cache")
+    # generate() blocking I/O (GIL dilepas saat menunggu respons), jadi thread cukup
+    with ThreadPoolExecutor(max_workers=max(1, min(_MAX_CONCURRENCY, len(prompts)))) as ex:
+        raws = list(ex.map(lambda p: client.generate(p, temperature=0.1, max_tokens=1500), prompts))
 
     # simpan raw/prompt untuk debug SELALU
-    (debug_dir / "last_prompt.txt").write_text(prompt or "", encoding="utf-8")
-    (debug_dir / "last_raw.txt").write_text(raw or "", encoding="utf-8")
+    (debug_dir / "last_prompt.txt").write_text(_DEBUG_SEP.join(prompts), encoding="utf-8")
+    (debug_dir / "last_raw.txt").write_text(_DEBUG_SEP.join(r or "" for r in raws), encoding="utf-8")
 
-    # --- parsing lebih toleran ---
     results = []
-
-    def _iter_json_objects(text: str):
-        import re, json as _json
-        if not text:
-            return
-        s = text.strip()
-        # array penuh
-        try:
-            if s.startswith("[") and s.endswith("]"):
-                arr = _json.loads(s)
-                for obj in arr:
-                    if isinstance(obj, dict):
-                        yield obj
-                return
-        except Exception:
-            pass
-        # hapus code fences
-        s = re.sub(r"```[\s\S]*?```", "", s)
-        # cari semua {...}
-        for m in re.finditer(r"\{[^{}]*\}", s, re.DOTALL):
-            frag = m.group(0)
-            try:
-                obj = _json.loads(frag)
-                if isinstance(obj, dict):
-                    yield obj
-            except Exception:
-                continue
-
-    for obj in _iter_json_objects(raw or ""):
-        url    = obj.get("url")
-        label  = (obj.get("label") or "INFO").upper()
-        reason = obj.get("reason") or ""
-        if url:
-            if label not in ("HIGH","MEDIUM","LOW","INFO"):
-                label = "INFO"
-            results.append({"url": url, "label": label, "reason": reason})
-
-    if not results:
-        # fallback pola "url=..., label=HIGH, reason=..."
-        for line in (raw or "").splitlines():
-            line = line.strip()
-            if "url=" in line and ("label=" in line or "risk=" in line):
-                parts = {}
-                for kv in line.replace(",", " ").split():
-                    if "=" in kv:
-                        k, v = kv.split("=", 1)
-                        parts[k.strip().lower()] = v.strip()
-                url = parts.get("url")
-                lab = (parts.get("label") or parts.get("risk") or "INFO").upper()
-                rea = parts.get("reason") or ""
-                if url:
-                    if lab not in ("HIGH","MEDIUM","LOW","INFO"):
-                        lab = "INFO"
-                    results.append({"url": url, "label": lab, "reason": rea})
+    for raw in raws:
+        results.extend(_parse_llm_output(raw or ""))
 
     tally = {"HIGH":0,"MEDIUM":0,"LOW":0,"INFO":0}
     for r in results:
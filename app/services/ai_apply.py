@@ -1,10 +1,15 @@
 # app/services/ai_apply.py
 from __future__ import annotations
-import json, re
+import os, re, uuid
 from dataclasses import dataclass
+from enum import IntEnum
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
+from . import _json, _procpool
+from .enrich_urls import dedupe_urls
+
 # ====== Helpers & paths ======
 
 def _cache_dir(outputs_root: Path, scope: str) -> Path:
@@ -18,6 +23,9 @@ def _path_url_enrich(outputs_root: Path, scope: str) -> Path:
 def _path_ai_classify(outputs_root: Path, scope: str) -> Path:
     return _cache_dir(outputs_root, scope) / "ai_classify.json"
 
+def _path_ai_classify_rows(outputs_root: Path, scope: str) -> Path:
+    return _cache_dir(outputs_root, scope) / "ai_classify.jsonl"
+
 def _path_seed_rules() -> Path:
     # sesuaikan bila lokasi seed-mu berbeda
     return Path(__file__).resolve().parent.parent / "data" / "ai_rules.seed.json"
@@ -32,7 +40,7 @@ def _safe_load_json(path: Path) -> Any:
     if not path.exists():
         return None
     try:
-        return json.loads(path.read_text(encoding="utf-8"))
+        return _json.load_file(path)
     except Exception:
         return None
 
@@ -60,7 +68,18 @@ def load_ai_rules(outputs_root: Path, scope: str) -> List[dict]:
 
 # ====== Normalization & validation ======
 
-_VALID_LABELS = {"HIGH","MEDIUM","LOW","INFO"}
+class Label(IntEnum):
+    """Severity sebagai int: perbandingan & demotion jadi aritmetika biasa."""
+    INFO = 1
+    LOW = 2
+    MEDIUM = 3
+    HIGH = 4
+
+_VALID_LABELS = frozenset(Label.__members__)
+# nama label per kode (index 0 = tidak ada label)
+_LABEL_NAMES = ("",) + tuple(l.name for l in Label)
+# urutan key counts di summary
+_COUNT_ORDER = (Label.HIGH, Label.MEDIUM, Label.LOW, Label.INFO)
 
 def _normalize_rules(rules: List[dict]) -> List[dict]:
     out = []
@@ -85,6 +104,7 @@ def _normalize_rules(rules: List[dict]) -> List[dict]:
             out.append({
                 "id": rid,
                 "label": lbl,
+                "lbl_code": int(Label[lbl]),
                 "reason": reason,
                 "pattern": pattern,
                 "code_in": code_in,
@@ -94,7 +114,11 @@ def _normalize_rules(rules: List[dict]) -> List[dict]:
     return out
 
 def _severity_weight(label: str) -> int:
-    return {"HIGH":4, "MEDIUM":3, "LOW":2, "INFO":1}.get(label.upper(), 0)
+    lbl = label.upper()
+    return int(Label[lbl]) if lbl in _VALID_LABELS else 0
+
+# prioritas sumber (dipakai jika severity sama)
+_SOURCE_PRIO = {"custom": 3, "ai": 2, "seed": 1}
 
 # ====== Compilation ======
 
@@ -106,25 +130,60 @@ class CompiledRule:
     regex: re.Pattern
     code_in: List[int]
     source: str  # "seed" | "custom" | "ai"
+    # dihitung sekali saat compile, supaya loop apply cukup membandingkan int.
+    # rank = label_code << 2 | src_prio -> urutan (severity, prioritas sumber)
+    label_code: int = 0
+    rank: int = 0
+    demoted_rank: int = 0
+    code_set: frozenset = frozenset()
+
+@lru_cache(maxsize=512)
+def compile_pattern(pattern: str) -> re.Pattern:
+    """Compile pattern rule (case-insensitive), di-cache supaya validasi & apply berbagi hasil."""
+    return re.compile(pattern, re.IGNORECASE)
 
 def compile_rules(rules: List[dict], source: str) -> List[CompiledRule]:
     out: List[CompiledRule] = []
+    src_prio = _SOURCE_PRIO.get(source, 0)
     for r in rules:
         try:
-            rx = re.compile(r["pattern"], re.IGNORECASE)
+            rx = compile_pattern(r["pattern"])
+            code = r.get("lbl_code") or _severity_weight(r["label"])
             out.append(CompiledRule(
                 id=r["id"],
                 label=r["label"],
                 reason=r["reason"],
                 regex=rx,
                 code_in=r.get("code_in", []) or [],
+                code_set=frozenset(r.get("code_in", []) or []),
                 source=source,
+                label_code=code,
+                rank=code << 2 | src_prio,
+                demoted_rank=_maybe_demote(code) << 2 | src_prio,
             ))
         except Exception:
             # skip invalid regex
             continue
     return out
 
+def compile_prefilter(rules: List[CompiledRule]) -> Optional[re.Pattern]:
+    """
+    Gabungkan semua pattern jadi satu alternation `(?P<rule_0>...)|(?P<rule_1>...)|...`
+    sebagai gate: URL yang tidak cocok dengan gabungan ini pasti tidak cocok dengan
+    rule mana pun, jadi cukup satu scan regex per URL untuk mayoritas korpus.
+    Return None (tanpa gate) kalau ada pattern dengan group sendiri (backreference
+    bisa bergeser nomornya) atau gabungan gagal di-compile.
+    """
+    if not rules or any(r.regex.groups for r in rules):
+        return None
+    try:
+        return re.compile(
+            "|".join(f"(?P<rule_{i}>{r.regex.pattern})" for i, r in enumerate(rules)),
+            re.IGNORECASE,
+        )
+    except re.error:
+        return None
+
 # ====== Core Apply ======
 
 @dataclass
@@ -134,11 +193,98 @@ class ApplyOptions:
     sample_limit: int = 500      # berapa baris dimasukkan ke results_sample
     limit_sample: Optional[int] = None
 
-def _maybe_demote(label: str) -> str:
-    # turunkan 1 tingkat: HIGH->MEDIUM->LOW->INFO
-    steps = ["INFO","LOW","MEDIUM","HIGH"]
-    idx = steps.index(label) if label in steps else 0
-    return steps[max(0, idx-1)]
+# versi layout ai_classify.json yang ditulis apply_rules:
+#   1 (tanpa key "format") = {"summary", "results": [...]}
+#   2 = {"format": 2, "summary", "results_file": "<jsonl>", "results_sample": [...]}
+CLASSIFY_FORMAT = 2
+
+# di bawah ini overhead spawn worker lebih mahal dari kerja regex-nya
+_PARALLEL_MIN_URLS = 20000
+_SHARD_SIZE = 4096
+
+def _code_of(rec: Any) -> Optional[int]:
+    """HTTP code dari record korpus -> int, atau None kalau tidak ada/invalid."""
+    code = rec.get("code") if isinstance(rec, dict) else None
+    try:
+        return int(code) if code is not None else None
+    except Exception:
+        return None
+
+# turunkan 1 tingkat: HIGH->MEDIUM->LOW->INFO (INFO tetap INFO)
+_DEMOTE = {l: Label(max(Label.INFO, l - 1)) for l in Label}
+
+def _maybe_demote(code: int) -> Label:
+    return _DEMOTE.get(code, Label.INFO)
+
+def _classify_shard(
+    urls: List[str],
+    codes: List[Optional[int]],
+    rules: List[CompiledRule],
+    prefilter: Optional[re.Pattern],
+    options: ApplyOptions,
+) -> Tuple[List[dict], List[int]]:
+    """
+    Klasifikasikan satu shard URL; tanpa state lintas URL, aman dijalankan di worker.
+    Return (rows, jumlah per kode label) -- counts dihitung sekalian di loop yang sama.
+    """
+    out: List[dict] = []
+    n_by_code = [0] * len(_LABEL_NAMES)
+    # dispatch table: method & field rule di-bind sekali per shard, supaya loop
+    # dalam tidak membayar attribute lookup per (url, rule).
+    # Diurutkan rank desc (stabil -> urutan asli jadi tie-break), jadi match
+    # pertama pasti pemenang dan loop bisa langsung break. Versi demote punya
+    # urutan sendiri karena demotion bisa menyamakan rank (LOW & INFO -> INFO).
+    table = [(r.regex.search, r.code_set, r.rank, r)
+             for r in sorted(rules, key=lambda r: r.rank, reverse=True)]
+    table_demoted = [(r.regex.search, r.code_set, r.demoted_rank, r)
+                     for r in sorted(rules, key=lambda r: r.demoted_rank, reverse=True)]
+    pre_search = prefilter.search if prefilter is not None else None
+    http_required = bool(getattr(options, "http_required", False))
+    demote_no_code = bool(options.demote_if_no_code)
+    append = out.append
+
+    for url, code_i in zip(urls, codes):
+        # satu scan regex gabungan: tidak ada rule yang cocok -> skip URL ini
+        if pre_search is not None and not pre_search(url):
+            continue
+
+        no_code = code_i is None
+        # jika require HTTP code, skip yang tidak punya
+        if http_required and no_code:
+            continue
+
+        # demote jika tidak ada HTTP code & opsi aktif
+        demote = demote_no_code and no_code
+
+        # rank pemenang; -1 = belum ada
+        best_rank = -1
+        best: Optional[CompiledRule] = None
+
+        for search, code_set, rank, rule in (table_demoted if demote else table):
+            # filter berdasarkan code_in jika di-rule dipasang
+            if code_set and not no_code and code_i not in code_set:
+                continue
+
+            # cocokkan regex terhadap URL; rule sudah terurut -> match pertama menang
+            if search(url):
+                best_rank, best = rank, rule
+                break
+
+        if best is not None:
+            code = best_rank >> 2
+            n_by_code[code] += 1
+            best_label = _LABEL_NAMES[code]
+            append({
+                "url": url,
+                "label": best_label,
+                "reason": best.reason,
+                "final_label": best_label,
+                "final_reason": best.reason,
+                "source": best.source,  # 'seed'/'custom'/'ai'
+                "rule_id": best.id,     # id rule spesifik
+                "code": code_i,
+            })
+    return out, n_by_code
 
 def apply_rules(
     outputs_root: Path,
@@ -152,7 +298,9 @@ def apply_rules(
     - Mendukung pembatasan jumlah URL yang diproses (options.limit_sample) agar cepat untuk preview.
     - Menggabungkan beberapa sumber rules; jika bentrok, severity tertinggi menang, kalau sama
       pakai prioritas sumber: custom > ai > seed.
-    - Tulis hasil ringkas ke __cache/ai_classify.json untuk ditampilkan di UI.
+    - Tulis baris hasil ke __cache/ai_classify.jsonl (streaming) dan ringkasan + sample
+      ke __cache/ai_classify.json (format 2, tanpa `results`) untuk ditampilkan di UI.
+    - Return hanya summary/results_file/results_sample; baris lengkap dibaca dari JSONL.
     """
     options = options or ApplyOptions()
     cache_dir = _cache_dir(outputs_root, scope)  # noqa: F841 (disiapkan untuk future use)
@@ -167,7 +315,8 @@ def apply_rules(
                 for ln in urls_txt.read_text(encoding="utf-8", errors="ignore").splitlines()
                 if ln.strip()
             ]
-            url_map = {ln: {} for ln in lines}
+            # urls.txt gabungan banyak sumber -> sering duplikat; rules cukup dinilai sekali
+            url_map = dict.fromkeys(dedupe_urls(lines), {})
 
     if not url_map:
         return {"ok": False, "error": "No URL corpus (url_enrich.json or urls.txt)"}
@@ -187,89 +336,50 @@ def apply_rules(
         return {"ok": False, "error": "No rules for selected sources"}
 
     # 3) apply
-    counts = {"HIGH": 0, "MEDIUM": 0, "LOW": 0, "INFO": 0}
-    classified: List[dict] = []
-
-    # prioritas sumber (dipakai jika severity sama)
-    source_prio = {"custom": 3, "ai": 2, "seed": 1}
-
-    def better(curr: Optional[Tuple[int, int]], cand_label: str, cand_src_tag: str) -> bool:
-        """
-        Bandingkan kandidat (label, sumber).
-        curr: tuple (severity_weight, source_priority) dari kandidat terbaik saat ini.
-        Kembalikan True jika kandidat baru lebih baik.
-        """
-        sev = _severity_weight(cand_label)
-        srcp = source_prio.get(cand_src_tag, 0)
-        if curr is None:
-            return True
-        c_sev, c_srcp = curr
-        if sev != c_sev:
-            return sev > c_sev
-        return srcp > c_srcp
-
     # batasi jumlah URL yang diproses untuk preview bila diminta
-    items = list(url_map.items())
+    urls = list(url_map)
     if getattr(options, "limit_sample", None):
-        items = items[: int(options.limit_sample)]
+        urls = urls[: int(options.limit_sample)]
+    # SoA: HTTP code di-parse sekali ke list paralel, bukan per iterasi dari dict
+    codes = [_code_of(url_map[u]) for u in urls]
+
+    prefilter = compile_prefilter(rules_all)
+    shards = [(urls[k:k + _SHARD_SIZE], codes[k:k + _SHARD_SIZE])
+              for k in range(0, len(urls), _SHARD_SIZE)]
+
+    # baris hasil di-stream ke ai_classify.jsonl per shard (memori dibatasi ~1 shard)
+    n_by_code = [0] * len(_LABEL_NAMES)
+    sample: List[dict] = []
+    sample_limit = max(0, int(options.sample_limit or 0))
+    rows_path = _path_ai_classify_rows(outputs_root, scope)
+    # tmp per run: apply paralel di scope yang sama tidak saling menimpa
+    tmp = rows_path.with_suffix(f"{rows_path.suffix}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
 
-    for url, rec in items:
-        # HTTP code (jika ada)
-        code = rec.get("code")
-        try:
-            code_i = int(code) if code is not None else None
-        except Exception:
-            code_i = None
-
-        # jika require HTTP code, skip yang tidak punya
-        if getattr(options, "http_required", False) and code_i is None:
-            continue
-
-        best_tuple: Optional[Tuple[int, int]] = None
-        best_label: Optional[str] = None
-        best_reason: Optional[str] = None
-        best_src_tag: Optional[str] = None  # 'seed'/'custom'/'ai'
-        best_rule_id: Optional[str] = None  # id rule spesifik
-
-        for rule in rules_all:
-            # filter berdasarkan code_in jika di-rule dipasang
-            if rule.code_in and code_i is not None and code_i not in rule.code_in:
-                continue
-
-            # cocokkan regex terhadap URL
-            if not rule.regex.search(url):
-                continue
-
-            lab = rule.label
-            # demote jika tidak ada HTTP code & opsi aktif
-            if options.demote_if_no_code and code_i is None:
-                lab = _maybe_demote(lab)
-
-            if better(best_tuple, lab, rule.source):
-                best_tuple = (_severity_weight(lab), source_prio.get(rule.source, 0))
-                best_label = lab
-                best_reason = rule.reason
-                best_src_tag = rule.source
-                best_rule_id = rule.id
-
-        if best_label:
-            row = {
-                "url": url,
-                "label": best_label,
-                "reason": best_reason,
-                "final_label": best_label,
-                "final_reason": best_reason,
-                "source": best_src_tag,
-                "rule_id": best_rule_id,
-                "code": code_i,
-            }
-            classified.append(row)
+    try:
+        with tmp.open("wb") as f:
+            def _emit(rows: List[dict], n: List[int]) -> None:
+                f.writelines(_json.dumps(r) + b"\n" for r in rows)
+                for k, v in enumerate(n):
+                    n_by_code[k] += v
+                if len(sample) < sample_limit:
+                    sample.extend(rows[: sample_limit - len(sample)])
+
+            if len(urls) >= _PARALLEL_MIN_URLS:
+                # korpus besar: shard ke pool proses bersama (re tidak melepas GIL, jadi
+                # thread tidak membantu untuk loop regex ini); urutan shard dijaga
+                jobs = ((su, sc, rules_all, prefilter, options) for su, sc in shards)
+                for res in _procpool.map_ordered(_classify_shard, jobs):
+                    _emit(*res)
+            else:
+                for su, sc in shards:
+                    _emit(*_classify_shard(su, sc, rules_all, prefilter, options))
+        tmp.replace(rows_path)
+    finally:
+        # shard gagal -> jangan tinggalkan JSONL parsial
+        tmp.unlink(missing_ok=True)
 
-    # 4) ringkas
-    for row in classified:
-        lbl = row["label"]
-        if lbl in counts:
-            counts[lbl] += 1
+    # 4) ringkas (counts sudah dihitung per kode int; balik ke nama label untuk output)
+    counts = {l.name: n_by_code[l] for l in _COUNT_ORDER}
 
     summary = {
         "rules_version": "+".join(sources) if sources else "none",
@@ -278,23 +388,18 @@ def apply_rules(
         "total_source": total_source,
         "note": "Applied rules"
         + (" with HTTP demotion" if options.demote_if_no_code else "")
-        + (f"; limited to {len(items)} URLs" if getattr(options, "limit_sample", None) else ""),
+        + (f"; limited to {len(urls)} URLs" if getattr(options, "limit_sample", None) else ""),
     }
 
-    # hasil yang disimpan untuk UI (kalau limit_sample aktif, memang sudah terbatas)
-    results_to_save = classified
-    if getattr(options, "limit_sample", None):
-        # jaga2 bila di masa depan proses tidak membatasi di depan
-        results_to_save = classified[: int(options.limit_sample)]
-
+    # format 2: baris lengkap di results_file (JSONL), bukan key `results`
     out = {
+        "format": CLASSIFY_FORMAT,
         "summary": summary,
-        "results": results_to_save,
+        "results_file": rows_path.name,
+        "results_sample": sample,
     }
 
-    # 5) tulis ke disk
-    _path_ai_classify(outputs_root, scope).write_text(
-        json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8"
-    )
+    # 5) tulis ringkasan ke disk (baris lengkap sudah di ai_classify.jsonl)
+    _json.write_file(_path_ai_classify(outputs_root, scope), out, indent=True)
 
     return {"ok": True, **out}
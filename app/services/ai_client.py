@@ -1,32 +1,171 @@
 # app/services/ai_client.py
 from __future__ import annotations
-import os, json, urllib.request, urllib.error
+import hashlib, os, threading, time, urllib.request, urllib.error
+from pathlib import Path
+from typing import Dict, Iterator
+
+from . import _json
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - fallback ke urllib
+    httpx = None
+
+_TRANSPORT_ERRORS = (urllib.error.URLError,) + ((httpx.HTTPError,) if httpx is not None else ())
+
+# satu client per proses: koneksi (TCP/TLS) dipakai ulang antar panggilan generate()
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+def _session():
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                try:
+                    _SESSION = httpx.Client(timeout=240, http2=True)
+                except ImportError:  # paket h2 tidak ada -> HTTP/1.1 keep-alive
+                    _SESSION = httpx.Client(timeout=240)
+    return _SESSION
+
+def _post_lines(url: str, body: dict, headers: Dict[str, str], timeout: float) -> Iterator[bytes]:
+    """POST JSON lalu yield body respons per baris (bytes); pakai httpx kalau ada."""
+    data = _json.dumps(body)
+    if httpx is not None:
+        with _session().stream("POST", url, content=data, headers=headers, timeout=timeout) as resp:
+            resp.raise_for_status()
+            for ln in resp.iter_lines():
+                yield ln.encode("utf-8")
+        return
+    req = urllib.request.Request(url, data=data, headers=headers)
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        yield from resp
+
+# parameter request yang ikut menentukan isi jawaban -> dipakai di body & key cache
+_OLLAMA_EXTRA = {"format": "json", "num_ctx": 2048}
+_OPENAI_SYSTEM = "You are a security testing assistant. Be concise."
+
+# naikkan kalau format request/parsing berubah: entry cache lama otomatis tidak terpakai
+_CACHE_VERSION = 2
+_CACHE_TTL_DEFAULT = 7 * 24 * 3600       # detik
+_CACHE_MAX_ENTRIES_DEFAULT = 2000
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
 
 class AIClient:
     """
     Minimal client:
       - Ollama: http://localhost:11434 (default), model via AI_MODEL (default 'llama3.1:8b')
       - OpenAI (opsional): set AI_PROVIDER=openai + OPENAI_API_KEY + AI_MODEL
+      - Cache respons (opsional): cache_dir / AI_CACHE_DIR, TTL via AI_CACHE_TTL (detik,
+        default 7 hari; 0 = tanpa expiry), maks entry via AI_CACHE_MAX_ENTRIES (default 2000)
     """
-    def __init__(self):
+    def __init__(self, cache_dir: Path | str | None = None):
         self.provider = os.environ.get("AI_PROVIDER", "ollama").strip().lower()
         self.model = os.environ.get("AI_MODEL", "llama3.1:8b")
         default_ollama = "http://host.docker.internal:11434" if os.path.exists("/.dockerenv") else "http://localhost:11434"
         self.ollama_host = os.environ.get("OLLAMA_HOST", default_ollama).rstrip("/")
         self.openai_key = os.environ.get("OPENAI_API_KEY")
+        cache_dir = cache_dir or os.environ.get("AI_CACHE_DIR")
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.cache_ttl = _env_int("AI_CACHE_TTL", _CACHE_TTL_DEFAULT)
+        self.cache_max_entries = max(1, _env_int("AI_CACHE_MAX_ENTRIES", _CACHE_MAX_ENTRIES_DEFAULT))
 
     def generate(self, prompt: str, temperature: float = 0.2, max_tokens: int = 1024) -> str:
-        return self._openai_chat(prompt, temperature, max_tokens) if self.provider == "openai" else self._ollama_generate(prompt, temperature)
+        cache_path = self._cache_path(prompt, temperature, max_tokens)
+        cached = self._cache_get(cache_path)
+        if cached is not None:
+            return cached
+        out = self._openai_chat(prompt, temperature, max_tokens) if self.provider == "openai" else self._ollama_generate(prompt, temperature)
+        # hanya jawaban lengkap yang di-cache; error/stream terpotong = sentinel "[AI error"
+        if out and not out.startswith("[AI error"):
+            self._cache_put(cache_path, out)
+        return out
+
+    # ---------- response cache (exact match) ----------
+    def _cache_path(self, prompt: str, temperature: float, max_tokens: int) -> Path | None:
+        if self.cache_dir is None:
+            return None
+        # endpoint + model + semua opsi request masuk key: ganti model/host/opsi = miss
+        if self.provider == "openai":
+            endpoint, extra = "openai", _OPENAI_SYSTEM
+        else:
+            endpoint, extra = self.ollama_host, _json.dumps(_OLLAMA_EXTRA).decode()
+        ident = f"v{_CACHE_VERSION}|{self.provider}|{endpoint}|{self.model}|{temperature}|{max_tokens}|{extra}|{prompt}"
+        key = hashlib.sha256(ident.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.txt"
+
+    def _expired(self, mtime: float, now: float) -> bool:
+        return self.cache_ttl > 0 and now - mtime > self.cache_ttl
+
+    def _cache_get(self, path: Path | None) -> str | None:
+        if path is None:
+            return None
+        try:
+            if self._expired(path.stat().st_mtime, time.time()):
+                path.unlink(missing_ok=True)
+                return None
+            return path.read_text(encoding="utf-8")
+        except OSError:
+            return None
+
+    def _cache_prune(self, keep: Path) -> None:
+        """Buang entry kedaluwarsa, lalu yang tertua sampai jumlahnya <= cache_max_entries."""
+        now = time.time()
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for e in it:
+                    if e.name.endswith(".txt") and e.name != keep.name and e.is_file():
+                        entries.append((e.stat().st_mtime, e.path))
+        except OSError:
+            return
+        entries.sort()
+        excess = len(entries) + 1 - self.cache_max_entries  # +1 = entry `keep`
+        for i, (mtime, fp) in enumerate(entries):
+            if i >= excess and not self._expired(mtime, now):
+                break  # terurut mtime: sisanya lebih baru
+            try:
+                os.unlink(fp)
+            except OSError:
+                pass
+
+    def _cache_put(self, path: Path | None, text: str) -> None:
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(text, encoding="utf-8")
+            tmp.replace(path)
+        except OSError:
+            return  # cache gagal ditulis bukan alasan untuk gagal generate
+        self._cache_prune(keep=path)
 
     def _ollama_generate(self, prompt: str, temperature: float) -> str:
         url = f"{self.ollama_host}/api/generate"
-        body = {"model": self.model, "prompt": prompt, "stream": False, "options": {"temperature": temperature},"format": "json", "num_ctx": 2048}
-        req = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"), headers={"Content-Type":"application/json"})
+        body = {"model": self.model, "prompt": prompt, "stream": True, "options": {"temperature": temperature}, **_OLLAMA_EXTRA}
         try:
-            with urllib.request.urlopen(req, timeout=240) as resp:
-                data = json.loads(resp.read().decode("utf-8"))
-                return data.get("response", "").strip()
-        except urllib.error.URLError as e:
+            # stream NDJSON: tiap baris {"response": "<potongan>", "done": bool}
+            buf = []
+            for raw in _post_lines(url, body, {"Content-Type":"application/json"}, 240):
+                if not raw.strip():
+                    continue
+                try:
+                    chunk = _json.loads(raw)
+                except ValueError:
+                    continue
+                if chunk.get("error"):
+                    return f"[AI error: ollama: {chunk['error']}]"
+                buf.append(chunk.get("response", ""))
+                if chunk.get("done"):
+                    return "".join(buf).strip()
+            return "[AI error: ollama stream ended before done]"
+        except _TRANSPORT_ERRORS as e:
             return f"[AI error: ollama connection failed: {e}]"
 
     def _openai_chat(self, prompt: str, temperature: float, max_tokens: int) -> str:
@@ -36,17 +175,33 @@ class AIClient:
         body = {
             "model": self.model,
             "messages": [
-                {"role":"system","content":"You are a security testing assistant. Be concise."},
+                {"role":"system","content": _OPENAI_SYSTEM},
                 {"role":"user","content": prompt}
             ],
             "temperature": temperature,
-            "max_tokens": max_tokens
+            "max_tokens": max_tokens,
+            "stream": True,
         }
         headers = {"Content-Type":"application/json","Authorization": f"Bearer {self.openai_key}"}
-        req = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"), headers=headers)
         try:
-            with urllib.request.urlopen(req, timeout=120) as resp:
-                data = json.loads(resp.read().decode("utf-8"))
-                return (data.get("choices") or [{}])[0].get("message",{}).get("content","").strip()
-        except urllib.error.URLError as e:
+            # SSE: baris "data: {...}" berisi delta, diakhiri "data: [DONE]"
+            buf = []
+            for raw in _post_lines(url, body, headers, 120):
+                raw = raw.strip()
+                if not raw.startswith(b"data:"):
+                    continue
+                payload = raw[5:].strip()
+                if payload == b"[DONE]":
+                    return "".join(buf).strip()
+                try:
+                    chunk = _json.loads(payload)
+                except ValueError:
+                    continue
+                if chunk.get("error"):
+                    err = chunk["error"]
+                    return f"[AI error: openai: {err.get('message', err) if isinstance(err, dict) else err}]"
+                delta = (chunk.get("choices") or [{}])[0].get("delta") or {}
+                buf.append(delta.get("content") or "")
+            return "[AI error: openai stream ended before [DONE]]"
+        except _TRANSPORT_ERRORS as e:
             return f"[AI error: openai connection failed: {e}]"
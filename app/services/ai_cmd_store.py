@@ -1,9 +1,11 @@
 from __future__ import annotations
-import json, time, uuid
+import time, uuid
 from dataclasses import dataclass, asdict
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 
+from . import _json
+
 @dataclass
 class Msg:
     role: str                # "user" | "assistant" | "system" | "tool"
@@ -29,22 +31,29 @@ class AiCmdStore:
         self.root = Path(outputs_root) / scope / "__cache" / "ai_cmd"
         self.root.mkdir(parents=True, exist_ok=True)
         self.idx_path = self.root / "threads.json"
+        # index ter-parse di-cache per instance, di-refresh kalau mtime file berubah
+        self._idx: Optional[Dict[str, ThreadInfo]] = None
+        self._idx_mtime: int = -1
 
     # ---------- index ----------
     def _load_index(self) -> Dict[str, ThreadInfo]:
-        if not self.idx_path.exists():
-            return {}
-        data = json.loads(self.idx_path.read_text(encoding="utf-8") or "{}")
+        try:
+            mt = self.idx_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mt = 0
+        if self._idx is not None and mt == self._idx_mtime:
+            return self._idx
         out: Dict[str, ThreadInfo] = {}
-        for tid, v in data.items():
-            out[tid] = ThreadInfo(**v)
+        if mt:
+            data = _json.loads(self.idx_path.read_bytes() or b"{}")
+            for tid, v in data.items():
+                out[tid] = ThreadInfo(**v)
+        self._idx, self._idx_mtime = out, mt
         return out
 
     def _save_index(self, idx: Dict[str, ThreadInfo]) -> None:
-        self.idx_path.write_text(
-            json.dumps({k: asdict(v) for k, v in idx.items()}, ensure_ascii=False, indent=2),
-            encoding="utf-8"
-        )
+        self.idx_path.write_bytes(_json.dumps({k: asdict(v) for k, v in idx.items()}, indent=True))
+        self._idx, self._idx_mtime = idx, self.idx_path.stat().st_mtime_ns
 
     # ---------- thread/files ----------
     def _thread_file(self, tid: str) -> Path:
@@ -67,11 +76,10 @@ class AiCmdStore:
         return info
 
     def append_msg(self, tid: str, msg: Msg) -> None:
-        line = json.dumps(asdict(msg), ensure_ascii=False)
-        self._thread_file(tid).write_text(
-            (self._thread_file(tid).read_text(encoding="utf-8") if self._thread_file(tid).exists() else "") + line + "\n",
-            encoding="utf-8"
-        )
+        line = _json.dumps(asdict(msg))
+        # append mode: cukup tulis baris baru (file dibuat otomatis kalau belum ada)
+        with self._thread_file(tid).open("ab") as f:
+            f.write(line + b"\n")
         idx = self._load_index()
         if tid in idx:
             idx[tid].updated_at = msg.ts
@@ -82,9 +90,9 @@ class AiCmdStore:
         p = self._thread_file(tid)
         if not p.exists(): return []
         msgs: List[Msg] = []
-        for ln in p.read_text(encoding="utf-8").splitlines()[-limit:]:
+        for ln in p.read_bytes().splitlines()[-limit:]:
             try:
-                row = json.loads(ln)
+                row = _json.loads(ln)
                 msgs.append(Msg(**row))
             except Exception:
                 pass
@@ -93,10 +101,10 @@ class AiCmdStore:
     # plan cache per thread
     def save_plan(self, tid: str, plan: Dict[str, Any]) -> Path:
         fp = self._plan_file(tid)
-        fp.write_text(json.dumps(plan, ensure_ascii=False, indent=2), encoding="utf-8")
+        fp.write_bytes(_json.dumps(plan, indent=True))
         return fp
 
     def load_plan(self, tid: str) -> Optional[Dict[str, Any]]:
         fp = self._plan_file(tid)
         if not fp.exists(): return None
-        return json.loads(fp.read_text(encoding="utf-8"))
+        return _json.loads(fp.read_bytes())
@@ -1,10 +1,15 @@
 # app/services/ai_jobs.py
 from __future__ import annotations
 
-import json, time, re
+import atexit, hashlib, json, os, threading, time, re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from html import escape as _html_escape  # implementasi C, quote=True default
 from pathlib import Path
 from typing import Any, Dict, List, Callable, Optional, Tuple
 
+from . import _json
+
 CACHE_NAME_LAST_PLAN   = "ai_command_last_plan.json"
 CACHE_NAME_JOB_STATUS  = "ai_jobs.json"  # status+logs terakhir
 
@@ -15,16 +20,28 @@ def _cache_dir(outputs_root: Path, scope: str) -> Path:
     d.mkdir(parents=True, exist_ok=True)
     return d
 
+# hash isi terakhir per file plan: save berulang dengan plan identik tidak menulis ulang
+_LAST_HASH: Dict[str, bytes] = {}
+
+def _write_plan_file(p: Path, plan: Dict[str, Any]) -> None:
+    data = _json.dumps(plan, indent=True)
+    h = hashlib.blake2b(data, digest_size=8).digest()
+    key = str(p)
+    if _LAST_HASH.get(key) == h and p.exists():
+        return
+    _json.write_bytes(p, data)
+    _LAST_HASH[key] = h
+
 def save_last_plan(outputs_root: Path, scope: str, plan: Dict[str, Any]) -> Path:
     p = _cache_dir(outputs_root, scope) / CACHE_NAME_LAST_PLAN
-    p.write_text(json.dumps(plan, ensure_ascii=False, indent=2), encoding="utf-8")
+    _write_plan_file(p, plan)
     return p
 
 def load_last_plan(outputs_root: Path, scope: str) -> Dict[str, Any] | None:
     p = _cache_dir(outputs_root, scope) / CACHE_NAME_LAST_PLAN
     if p.exists():
         try:
-            return json.loads(p.read_text(encoding="utf-8"))
+            return _json.loads(p.read_bytes())
         except Exception:
             return None
     return None
@@ -33,26 +50,47 @@ def _job_status_path(outputs_root: Path, scope: str) -> Path:
     return _cache_dir(outputs_root, scope) / CACHE_NAME_JOB_STATUS
 
 def _write_status(outputs_root: Path, scope: str, payload: Dict[str, Any]) -> None:
-    _job_status_path(outputs_root, scope).write_text(
-        json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8"
-    )
+    _json.write_file(_job_status_path(outputs_root, scope), payload, indent=True)
+
+class _StatusWriter:
+    """
+    Debounce penulisan status: mark_dirty() hanya menulis kalau sudah lewat
+    min_interval sejak flush terakhir (atau force=True); flush() memaksa tulis
+    state terakhir.
+    """
+    def __init__(self, outputs_root: Path, scope: str, state: Dict[str, Any], min_interval: float = 0.5):
+        self.outputs_root = outputs_root
+        self.scope = scope
+        self.state = state
+        self.min_interval = min_interval
+        self.last_flush_ts = 0.0
+        self.dirty = False
+
+    def mark_dirty(self, force: bool = False) -> None:
+        self.dirty = True
+        if force or time.monotonic() - self.last_flush_ts >= self.min_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.dirty:
+            return
+        _write_status(self.outputs_root, self.scope, self.state)
+        self.last_flush_ts = time.monotonic()
+        self.dirty = False
 
 def _append_log(state: Dict[str, Any], msg: str) -> None:
     state.setdefault("logs", []).append({"ts": int(time.time()), "msg": msg})
 
 # ----------------- helpers -----------------
 
-_DOMAIN_RE = re.compile(r"^(?:https?://)?([^/]+)$")
-
 def _host_from_any(s: str) -> Optional[str]:
-    s = s.strip()
+    # ambil host dari URL atau host polos (tanpa regex: split jauh lebih murah per baris)
+    s = s.strip().lower()
     if not s:
         return None
-    # ambil host dari URL atau host polos
-    m = _DOMAIN_RE.match(s)
-    if m:
-        return m.group(1).strip().lower()
-    return None
+    if "://" in s:
+        s = s.split("://", 1)[1]
+    return s.split("/", 1)[0] or None
 
 def _read_lines(p: Path) -> List[str]:
     try:
@@ -61,7 +99,10 @@ def _read_lines(p: Path) -> List[str]:
         return []
 
 def _unique_sorted(items: List[str]) -> List[str]:
-    return sorted(set(items), key=lambda x: (x.count("."), x))
+    # decorate-sort-undecorate: tanpa panggilan lambda per item, sort murni tuple
+    keyed = [(h.count("."), h) for h in set(items)]
+    keyed.sort()
+    return [h for _, h in keyed]
 
 # ----------------- actions -----------------
 
@@ -154,9 +195,32 @@ def _act_analyze(outputs_root: Path, scope: str, args: Dict[str, Any]) -> Dict[s
                 "message": "Silakan jalankan pengumpulan URL (seperti GAU/Waymore) terlebih dahulu, lalu jalankan klasifikasi AI untuk laporan mendalam!"
             }
         }
-    data = json.loads(f.read_text(encoding="utf-8"))
+    data = _json.loads(f.read_bytes())
     return {"ok": True, "summary": data.get("summary", {})}
 
+# code HTTP yang dianggap "alive" bila flag alive tidak ada
+_ALIVE_CODES = frozenset((200, 301, 302))
+
+def _alive_sources(outputs_root: Path, scope: str) -> Tuple[Path, Path, Path, Path]:
+    root = outputs_root / scope
+    cache = _cache_dir(outputs_root, scope)
+    return (
+        cache / "subdomains_enrich.json",
+        cache / "subdomains_alive.txt",
+        root / "subdomains" / "alive.txt",
+        root / "subdomains.txt",
+    )
+
+def _sources_sig(paths: Tuple[Path, ...]) -> Tuple[Tuple[str, int, int], ...]:
+    sig = []
+    for p in paths:
+        try:
+            st = p.stat()
+            sig.append((str(p), st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append((str(p), -1, -1))
+    return tuple(sig)
+
 def _collect_alive_subdomains(outputs_root: Path, scope: str) -> List[str]:
     """
     Cari subdomain 'alive' dari beberapa sumber umum.
@@ -165,7 +229,17 @@ def _collect_alive_subdomains(outputs_root: Path, scope: str) -> List[str]:
       2) __cache/subdomains_alive.txt
       3) subdomains/alive.txt
       4) subdomains.txt (fallback; tanpa filter alive)
+    Hasil di-memo per (path, mtime, size) semua sumber: selama file tidak berubah,
+    pemanggilan berikutnya tidak parse ulang.
     """
+    sig = _sources_sig(_alive_sources(outputs_root, scope))
+    return list(_collect_alive_cached(outputs_root, scope, sig))
+
+@lru_cache(maxsize=32)
+def _collect_alive_cached(outputs_root: Path, scope: str, sig: tuple) -> Tuple[str, ...]:
+    return tuple(_collect_alive_uncached(outputs_root, scope))
+
+def _collect_alive_uncached(outputs_root: Path, scope: str) -> List[str]:
     root = outputs_root / scope
 
     # 1) enrich json
@@ -173,15 +247,17 @@ def _collect_alive_subdomains(outputs_root: Path, scope: str) -> List[str]:
     hosts: List[str] = []
     if enrich_json.exists():
         try:
-            rows = json.loads(enrich_json.read_text(encoding="utf-8"))
-            for r in rows if isinstance(rows, list) else []:
-                host = r.get("host") or _host_from_any(r.get("url", "") or "")
-                if not host:
-                    continue
-                alive = r.get("alive")
-                code = r.get("code")
-                if alive is True or (isinstance(code, int) and code in (200, 301, 302)):
-                    hosts.append(host)
+            rows = _json.loads(enrich_json.read_bytes())
+            if isinstance(rows, list):
+                # filter alive dulu (murah), ekstraksi host hanya untuk baris yang lolos
+                alive_rows = [
+                    r for r in rows
+                    if r.get("alive") is True or (type(c := r.get("code")) is int and c in _ALIVE_CODES)
+                ]
+                hosts = [
+                    h for h in (r.get("host") or _host_from_any(r.get("url", "") or "") for r in alive_rows)
+                    if h
+                ]
         except Exception:
             pass
     if hosts:
@@ -440,9 +516,49 @@ ACTION_REGISTRY: Dict[str, Callable[[Path, str, Dict[str, Any]], Dict[str, Any]]
 
 # ----------------- runner -----------------
 
+# executor bersama untuk action ber-flag `parallel: true` (I/O + parse JSON -> thread cukup)
+_ACTION_POOL: Optional[ThreadPoolExecutor] = None
+_ACTION_POOL_LOCK = threading.Lock()
+
+def _action_pool() -> ThreadPoolExecutor:
+    global _ACTION_POOL
+    with _ACTION_POOL_LOCK:
+        if _ACTION_POOL is None:
+            _ACTION_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="ai-action")
+            atexit.register(_ACTION_POOL.shutdown, wait=False)
+        return _ACTION_POOL
+
+def _run_action(outputs_root: Path, scope: str, tool: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    fn = ACTION_REGISTRY.get(tool) or ACTION_REGISTRY.get(tool.lower())
+    if fn is None:
+        return {"ok": False, "error": f"Unknown tool: {tool}"}
+    try:
+        return fn(outputs_root, scope, args)
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+
+def _plan_segments(actions: List[Dict[str, Any]]) -> List[List[Tuple[int, Dict[str, Any]]]]:
+    """
+    Pecah actions jadi segmen berurutan. Action ber-args `parallel: true` yang
+    bersebelahan digabung satu segmen (dijalankan bersamaan); `wait: true`
+    menutup segmen paralel (barrier). Action lain tetap satu per segmen.
+    """
+    segs: List[List[Tuple[int, Dict[str, Any]]]] = []
+    open_par = False
+    for idx, act in enumerate(actions, start=1):
+        args = act.get("args") or {}
+        par = bool(args.get("parallel"))
+        if par and open_par and not args.get("wait"):
+            segs[-1].append((idx, act))
+        else:
+            segs.append([(idx, act)])
+        open_par = par
+    return segs
+
 def run_plan_now(outputs_root: Path, scope: str, plan: Dict[str, Any]) -> Dict[str, Any]:
     """
     Eksekusi plan secara sinkron. Menulis status/log ke __cache/ai_jobs.json.
+    Action yang opt-in `parallel: true` dijalankan bersamaan di thread pool.
     """
     state: Dict[str, Any] = {
         "ok": True,
@@ -453,45 +569,52 @@ def run_plan_now(outputs_root: Path, scope: str, plan: Dict[str, Any]) -> Dict[s
         "logs": [],
     }
     actions: List[Dict[str, Any]] = plan.get("actions") or []
-    _append_log(state, f"Start plan with {len(actions)} action(s)")
-    _write_status(outputs_root, scope, state)
+    total = len(actions)
+    # status ditulis ter-debounce (maks ~2x/detik), kecuali tepat sebelum action
+    # mulai & flush final: "[i/n] tool ..." selalu terlihat selama action berjalan
+    writer = _StatusWriter(outputs_root, scope, state)
+    _append_log(state, f"Start plan with {total} action(s)")
+    writer.mark_dirty()
 
-    for idx, act in enumerate(actions, start=1):
-        tool = (act.get("tool") or "").strip()
-        args = act.get("args") or {}
-        _append_log(state, f"[{idx}/{len(actions)}] {tool} ...")
-        _write_status(outputs_root, scope, state)
-
-        fn = ACTION_REGISTRY.get(tool) or ACTION_REGISTRY.get(tool.lower())
-        if fn is None:
-            res = {"ok": False, "error": f"Unknown tool: {tool}"}
-        else:
-            try:
-                res = fn(outputs_root, scope, args)
-            except Exception as e:
-                res = {"ok": False, "error": str(e)}
-
-        state["actions"].append({"tool": tool, "args": args, "result": res})
-        _append_log(state, ("✅ " if res.get("ok") else "❌ ") + tool)
-        _write_status(outputs_root, scope, state)
-
-    state["status"] = "done"
-    state["finished_at"] = int(time.time())
-    _append_log(state, "Plan finished")
-    _write_status(outputs_root, scope, state)
+    try:
+        for seg in _plan_segments(actions):
+            items = [(idx, (act.get("tool") or "").strip(), act.get("args") or {}) for idx, act in seg]
+            for idx, tool, _ in items:
+                _append_log(state, f"[{idx}/{total}] {tool} ...")
+            writer.mark_dirty(force=True)
+
+            if len(items) == 1:
+                _, tool, args = items[0]
+                results = [_run_action(outputs_root, scope, tool, args)]
+            else:
+                pool = _action_pool()
+                futs = [pool.submit(_run_action, outputs_root, scope, tool, args) for _, tool, args in items]
+                results = [f.result() for f in futs]  # urut idx -> log deterministik
+
+            for (_, tool, args), res in zip(items, results):
+                state["actions"].append({"tool": tool, "args": args, "result": res})
+                _append_log(state, ("✅ " if res.get("ok") else "❌ ") + tool)
+            writer.mark_dirty()
+
+        state["status"] = "done"
+        state["finished_at"] = int(time.time())
+        _append_log(state, "Plan finished")
+        writer.mark_dirty()
+    finally:
+        # apa pun yang terjadi, state terakhir harus sampai ke disk
+        writer.flush()
     return state
 
 # ----------------- HTML wrapper (untuk UI percakapan) -----------------
 
-def _html_escape(s: str) -> str:
-    return (s.replace("&","&amp;").replace("<","&lt;").replace(">","&gt;")
-              .replace('"',"&quot;").replace("'", "&#39;"))
+def _subdomain_item(host: str) -> str:
+    h = _html_escape(host)  # escape sekali, dipakai untuk href & teks
+    return f"<li><a href=\"http://{h}\" target=\"_blank\" rel=\"noopener\">{h}</a></li>"
 
 def _render_subdomains_list(hosts: List[str]) -> str:
     if not hosts:
         return "<div>Active subdomains (0):</div>"
-    items = "\n".join([f"<li><a href=\"http://{_html_escape(h)}\" target=\"_blank\" rel=\"noopener\">{_html_escape(h)}</a></li>"
-                       for h in hosts])
+    items = "\n".join(map(_subdomain_item, hosts))
     return f"""
       <div>Active subdomains ({len(hosts)}):</div>
       <ul class="list-disc ml-6 mt-1">{items}</ul>
@@ -520,7 +643,9 @@ def run_plan_actions(outputs_root: Path, scope: str, plan: Dict[str, Any]) -> st
             parts.append(_render_subdomains_list(hosts))
         else:
             # generic JSON
-            pretty = _html_escape(json.dumps(res, ensure_ascii=False, indent=2))
+            # isi <pre> = text node: kutip tidak perlu di-escape -> 2 pass replace lebih sedikit,
+            # dan output jauh lebih kecil untuk JSON (banyak tanda ")
+            pretty = _html_escape(_json.dumps(res, indent=True).decode("utf-8"), quote=False)
             parts.append(f"<pre class='text-xs bg-slate-50 border rounded p-2 overflow-auto'>{pretty}</pre>")
 
     return "\n".join(parts)
@@ -536,15 +661,14 @@ def plan_path(outputs_root: Path, scope: str) -> Path:
     return _jobs_dir(outputs_root, scope) / "plan.json"
 
 def set_current_plan(outputs_root: Path, scope: str, plan: Dict[str, Any]) -> None:
-    p = plan_path(outputs_root, scope)
-    p.write_text(json.dumps(plan, ensure_ascii=False, indent=2), encoding="utf-8")
+    _write_plan_file(plan_path(outputs_root, scope), plan)
 
 def get_current_plan(outputs_root: Path, scope: str) -> Optional[Dict[str, Any]]:
     p = plan_path(outputs_root, scope)
     if not p.exists():
         return None
     try:
-        return json.loads(p.read_text(encoding="utf-8"))
+        return _json.loads(p.read_bytes())
     except Exception:
         return None
 
@@ -1,18 +1,34 @@
 # app/services/ai_rulegen.py
 from __future__ import annotations
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+import itertools
 import json
 import random
 import re
 import time
 import requests
-import collections
+from requests.adapters import HTTPAdapter
+
+try:
+    import hyperscan
+except ImportError:  # pragma: no cover - dependency opsional
+    hyperscan = None
 
 import os
+
+from . import _json
+from .ai_apply import compile_pattern
+from .ai_rules import iter_url_lines
+
 DEFAULT_MODEL = "llama3.2:3b"
 DEFAULT_TIMEOUT = 60  # detik
 
+# satu Session per proses: koneksi keep-alive ke Ollama/cloud dipakai ulang antar panggilan
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
 def _get_ollama_base_url() -> str:
     env_host = os.environ.get("OLLAMA_HOST")
     if env_host:
@@ -55,16 +71,7 @@ def load_urls(outputs_root: Path, scope: str, limit: Optional[int] = None) -> Li
     p = _urls_path(outputs_root, scope)
     if not p.exists():
         return []
-    out: List[str] = []
-    with p.open("r", encoding="utf-8", errors="ignore") as f:
-        for ln in f:
-            s = (ln or "").strip()
-            if not s:
-                continue
-            out.append(s)
-            if limit and len(out) >= limit:
-                break
-    return out
+    return list(itertools.islice(iter_url_lines(p), limit or None))
 
 
 def sample_urls(urls: List[str], sample_size: int = 200) -> List[str]:
@@ -72,8 +79,33 @@ def sample_urls(urls: List[str], sample_size: int = 200) -> List[str]:
         return []
     if sample_size <= 0 or sample_size >= len(urls):
         return urls[:1000]  # guard
-    random.seed(42)
-    return random.sample(urls, sample_size)
+    # Random lokal: hasil sama dengan random.seed(42), tanpa mengubah state global
+    return random.Random(42).sample(urls, sample_size)
+
+
+def load_and_sample_urls(outputs_root: Path, scope: str, k: int = 200, seed: int = 42) -> List[str]:
+    """
+    Gabungan load_urls + sample_urls dengan reservoir sampling (Algorithm R):
+    memori O(k), bukan O(jumlah baris). Semantik guard sama dengan sample_urls.
+    """
+    p = _urls_path(outputs_root, scope)
+    if not p.exists():
+        return []
+    if k <= 0:
+        return load_urls(outputs_root, scope, limit=1000)
+    rng = random.Random(seed)
+    reservoir: List[str] = []
+    n = 0
+    for n, line in enumerate(iter_url_lines(p), start=1):
+        if n <= k:
+            reservoir.append(line)
+        else:
+            j = rng.randrange(n)
+            if j < k:
+                reservoir[j] = line
+    if n <= k:
+        return reservoir[:1000]  # file lebih kecil dari k: semua baris, urutan asli
+    return reservoir
 
 
 # ============================
@@ -196,6 +228,7 @@ def _call_ollama(
             "Never include wrapper keys like 'results', 'data', or 'summary'. "
             "No markdown, no explanations."
         )
+        fmt = None  # array top-level; format=json Ollama cenderung memaksa object
     elif mode == "command":
         if custom_system_prompt:
             if "Available Tools:" not in custom_system_prompt:
@@ -262,13 +295,13 @@ def _call_ollama(
         # if fmt == "json":
         #     payload["response_format"] = {"type": "json_object"}
 
-        r = requests.post(cloud_endpoint, json=payload, headers=headers, timeout=(5, timeout))
+        r = _SESSION.post(cloud_endpoint, json=payload, headers=headers, timeout=(5, timeout))
         r.raise_for_status()
-        data = r.json()
+        data = _json.loads(r.content)
 
         # OpenAI format: choices[0].message.content
         resp_text = (data.get("choices") or [{}])[0].get("message", {}).get("content") or ""
-        return resp_text
+        return _decode_content(resp_text) if mode == "rules" else resp_text
     else:
         # Local Ollama using /api/chat (native messages support!)
         url = f"{_get_ollama_base_url()}/api/chat"
@@ -301,15 +334,32 @@ def _call_ollama(
         if fmt == "json":
             payload["format"] = "json"
 
-        r = requests.post(url, json=payload, timeout=(5, timeout))
+        r = _SESSION.post(url, json=payload, timeout=(5, timeout))
         r.raise_for_status()
-        data = r.json()
-        return data.get("message", {}).get("content") or ""
+        data = _json.loads(r.content)
+        content = data.get("message", {}).get("content") or ""
+        return _decode_content(content) if mode == "rules" else content
+
+
+def _decode_content(text: str) -> Any:
+    """
+    Mode "rules": coba parse content langsung (orjson) supaya _parse_rules tidak
+    parse ulang; kalau bukan JSON murni (mis. ada code fence) kembalikan string
+    apa adanya untuk _json_loads_loose.
+    """
+    try:
+        data = _json.loads(text)
+    except _json.JSONDecodeError:
+        return text
+    return data if isinstance(data, (dict, list)) else text
 
 
 # ============================
 # Rule validation / fallback
 # ============================
+_ID_SANITIZE_RE = re.compile(r"[^a-zA-Z0-9_\-\.]")
+
+
 def _validate_and_normalize(rules: Any) -> List[Dict[str, Any]]:
     # dict with "rules" list
     if isinstance(rules, dict) and isinstance(rules.get("rules"), list):
@@ -330,7 +380,7 @@ def _validate_and_normalize(rules: Any) -> List[Dict[str, Any]]:
             continue
 
         rid = str(obj.get("id") or f"custom-{i+1}")
-        rid = re.sub(r"[^a-zA-Z0-9_\-\.]", "-", rid).lower()
+        rid = _ID_SANITIZE_RE.sub("-", rid).lower()
 
         label = (obj.get("label") or "INFO").upper()
         if label not in ("HIGH", "MEDIUM", "LOW", "INFO"):
@@ -343,14 +393,18 @@ def _validate_and_normalize(rules: Any) -> List[Dict[str, Any]]:
 
         code_in = obj.get("code_in") or [200, 206]
 
-        try:
-            re.compile(pattern)
-        except re.error:
-            continue
-
+        # dedupe sebelum compile: duplikat (umum saat retries menumpuk) tidak
+        # perlu divalidasi ulang. Hash str sudah di-cache CPython, jadi key
+        # tuple ini murah walau pattern panjang.
         key = (rid, pattern, label)
         if key in seen:
             continue
+
+        try:
+            # hasil compile di-cache & dipakai ulang saat rules diterapkan (ai_apply)
+            compile_pattern(pattern)
+        except re.error:
+            continue
         seen.add(key)
 
         out.append(
@@ -365,67 +419,78 @@ def _validate_and_normalize(rules: Any) -> List[Dict[str, Any]]:
     return out
 
 
+# tabel heuristik fallback; di-scan sekali untuk seluruh sampel lewat satu regex per tabel
+_FB_EXTS = (
+    ".zip", ".rar", ".7z", ".tar", ".tgz", ".tar.gz", ".gz", ".bz2",
+    ".sql", ".sqlite", ".db", ".dump", ".log", ".bak", ".old",
+    ".php", ".asp", ".aspx", ".jsp", ".rb", ".py", ".cgi",
+    ".doc", ".docx", ".xls", ".xlsx", ".csv", ".pdf", ".json", ".xml",
+)
+_FB_DIRS = (
+    "/admin", "/administrator", "/wp-admin", "/dashboard",
+    "/uploads", "/upload", "/filemanager", "/userfiles",
+    "/backup", "/backups", "/config", "/.env", "/phpinfo",
+    "/debug", "/test", "/tmp", "/logs", "/log",
+)
+
+# kategori keputusan rule: satu cek isdisjoint (level C) per kategori
+_FB_ARCHIVE_EXTS = frozenset((".zip", ".rar", ".7z", ".tar", ".tgz", ".tar.gz", ".gz", ".bz2"))
+_FB_DB_EXTS = frozenset((".sql", ".sqlite", ".db", ".dump"))
+_FB_SRC_EXTS = frozenset((".php", ".asp", ".aspx", ".jsp", ".rb", ".py", ".cgi"))
+_FB_DOC_EXTS = frozenset((".doc", ".docx", ".xls", ".xlsx", ".csv", ".pdf", ".json", ".xml"))
+_FB_ADMIN_DIRS = frozenset(("/admin", "/administrator", "/wp-admin", "/dashboard"))
+_FB_UPLOAD_DIRS = frozenset(("/uploads", "/upload", "/filemanager", "/userfiles"))
+_FB_CONFIG_DIRS = frozenset(("/config", "/.env"))
+_FB_LOG_DIRS = frozenset(("/logs", "/log"))
+
+def _substring_scanner(needles: tuple) -> "re.Pattern[str]":
+    # lookahead -> match di setiap posisi (boleh overlap, mis. ".tar.gz" & ".gz"),
+    # alternatif terpanjang dulu supaya yang spesifik menang di posisi yang sama
+    alts = "|".join(re.escape(n) for n in sorted(needles, key=len, reverse=True))
+    return re.compile(f"(?=({alts}))")
+
+_FB_EXT_RE = _substring_scanner(_FB_EXTS)
+_FB_DIR_RE = _substring_scanner(_FB_DIRS)
+
+# hyperscan (opsional): semua needle dalam satu DFA, satu scan untuk seluruh sampel
+_FB_NEEDLES = _FB_EXTS + _FB_DIRS
+_FB_HS_DB = None
+if hyperscan is not None:
+    try:
+        _FB_HS_DB = hyperscan.Database()
+        _FB_HS_DB.compile(
+            expressions=[re.escape(n).encode() for n in _FB_NEEDLES],
+            ids=list(range(len(_FB_NEEDLES))),
+            elements=len(_FB_NEEDLES),
+            flags=[0] * len(_FB_NEEDLES),
+        )
+    except Exception:
+        _FB_HS_DB = None
+
+
+def _fallback_hits_hs(buf: bytes) -> tuple[set, set]:
+    hits: set = set()
+
+    def on_match(idx, _from, _to, _flags, ctx):
+        ctx.add(idx)
+
+    _FB_HS_DB.scan(buf, match_event_handler=on_match, context=hits)
+    n_ext = len(_FB_EXTS)
+    exts = {_FB_EXTS[i] for i in hits if i < n_ext}
+    dirs = {_FB_DIRS[i - n_ext] for i in hits if i >= n_ext}
+    return exts, dirs
+
+
 def _fallback_rules_from_urls(urls: list[str], max_rules: int = 12) -> list[dict]:
-    exts = collections.Counter()
-    dirs = collections.Counter()
-    for u in urls:
-        low = u.lower()
-        for ext in (
-            ".zip",
-            ".rar",
-            ".7z",
-            ".tar",
-            ".tgz",
-            ".tar.gz",
-            ".gz",
-            ".bz2",
-            ".sql",
-            ".sqlite",
-            ".db",
-            ".dump",
-            ".log",
-            ".bak",
-            ".old",
-            ".php",
-            ".asp",
-            ".aspx",
-            ".jsp",
-            ".rb",
-            ".py",
-            ".cgi",
-            ".doc",
-            ".docx",
-            ".xls",
-            ".xlsx",
-            ".csv",
-            ".pdf",
-            ".json",
-            ".xml",
-        ):
-            if ext in low:
-                exts[ext] += 1
-        for d in (
-            "/admin",
-            "/administrator",
-            "/wp-admin",
-            "/dashboard",
-            "/uploads",
-            "/upload",
-            "/filemanager",
-            "/userfiles",
-            "/backup",
-            "/backups",
-            "/config",
-            "/.env",
-            "/phpinfo",
-            "/debug",
-            "/test",
-            "/tmp",
-            "/logs",
-            "/log",
-        ):
-            if d in low:
-                dirs[d] += 1
+    # keputusan rule hanya butuh "needle X muncul di sampel atau tidak", bukan hitungan
+    # per URL: gabung sampel jadi satu teks (needle tidak mengandung \n, jadi tidak ada
+    # match lintas URL) lalu satu scan di level C, bukan loop Python per URL
+    blob = "\n".join(urls).lower()
+    if _FB_HS_DB is not None:
+        exts, dirs = _fallback_hits_hs(blob.encode("utf-8"))
+    else:
+        exts = set(_FB_EXT_RE.findall(blob))
+        dirs = set(_FB_DIR_RE.findall(blob))
 
     rules: list[dict] = []
 
@@ -434,21 +499,21 @@ def _fallback_rules_from_urls(urls: list[str], max_rules: int = 12) -> list[dict
             {"id": _id, "label": _label, "reason": _reason, "pattern": _pattern, "code_in": _codes}
         )
 
-    if any(e in exts for e in [".zip", ".rar", ".7z", ".tar", ".tgz", ".tar.gz", ".gz", ".bz2"]):
+    if not _FB_ARCHIVE_EXTS.isdisjoint(exts):
         add_rule(
             "fb-high-archives",
             "HIGH",
             "Backup/source archives exposed",
             r"\.(?:zip|rar|7z|tar|tgz|tar\.gz|gz|bz2)$",
         )
-    if any(e in exts for e in [".sql", ".sqlite", ".db", ".dump"]):
+    if not _FB_DB_EXTS.isdisjoint(exts):
         add_rule(
             "fb-high-db",
             "HIGH",
             "Database dumps exposed",
             r"\.(?:sql|sqlite|db|dump)(?:\.(?:gz|bz2|zip))?$",
         )
-    if any(d in dirs for d in ["/admin", "/administrator", "/wp-admin", "/dashboard"]):
+    if not _FB_ADMIN_DIRS.isdisjoint(dirs):
         add_rule(
             "fb-medium-admin",
             "MEDIUM",
@@ -456,7 +521,7 @@ def _fallback_rules_from_urls(urls: list[str], max_rules: int = 12) -> list[dict
             r"/(?:admin|administrator|wp-admin|dashboard)(?:/|$)",
             [200, 302, 401, 403],
         )
-    if any(d in dirs for d in ["/uploads", "/upload", "/filemanager", "/userfiles"]):
+    if not _FB_UPLOAD_DIRS.isdisjoint(dirs):
         add_rule(
             "fb-medium-upload",
             "MEDIUM",
@@ -464,7 +529,7 @@ def _fallback_rules_from_urls(urls: list[str], max_rules: int = 12) -> list[dict
             r"/(?:uploads?|filemanager|userfiles?)(?:/|$)",
             [200, 403],
         )
-    if any(d in dirs for d in ["/config", "/.env"]):
+    if not _FB_CONFIG_DIRS.isdisjoint(dirs):
         add_rule(
             "fb-low-config",
             "LOW",
@@ -472,7 +537,7 @@ def _fallback_rules_from_urls(urls: list[str], max_rules: int = 12) -> list[dict
             r"/(?:\.env|config\.php|settings\.json)$",
             [200, 403],
         )
-    if any(d in dirs for d in ["/logs", "/log"]) or ".log" in exts:
+    if not _FB_LOG_DIRS.isdisjoint(dirs) or ".log" in exts:
         add_rule(
             "fb-low-logs",
             "LOW",
@@ -480,7 +545,7 @@ def _fallback_rules_from_urls(urls: list[str], max_rules: int = 12) -> list[dict
             r"/(?:access|error)\.log(?:\.\w+)?$",
             [200, 403],
         )
-    if any(e in exts for e in [".php", ".asp", ".aspx", ".jsp", ".rb", ".py", ".cgi"]):
+    if not _FB_SRC_EXTS.isdisjoint(exts):
         add_rule(
             "fb-info-src",
             "INFO",
@@ -488,7 +553,7 @@ def _fallback_rules_from_urls(urls: list[str], max_rules: int = 12) -> list[dict
             r"\.(?:php|asp|aspx|jsp|rb|py|cgi)$",
             [200, 403],
         )
-    if any(e in exts for e in [".doc", ".docx", ".xls", ".xlsx", ".csv", ".pdf", ".json", ".xml"]):
+    if not _FB_DOC_EXTS.isdisjoint(exts):
         add_rule(
             "fb-info-docs",
             "INFO",
@@ -511,11 +576,10 @@ def generate_rules_from_samples(
     temperature: float = 0.5,
     retries: int = 0,
 ) -> Dict[str, Any]:
-    urls = load_urls(outputs_root, scope)
-    if not urls:
+    sample = load_and_sample_urls(outputs_root, scope, k=sample_size)
+    if not sample:
         return {"ok": False, "error": "urls.txt not found or empty"}
 
-    sample = sample_urls(urls, sample_size=sample_size)
     prompt = _build_prompt(sample)
 
     dbg_dir = _cache_dir(outputs_root, scope) / "ai_debug"
@@ -557,7 +621,7 @@ def generate_rules_from_samples(
         fb = _fallback_rules_from_urls(sample, max_rules=12)
         if fb:
             out_path = _generated_rules_path(outputs_root, scope)
-            out_path.write_text(json.dumps(fb, ensure_ascii=False, indent=2), encoding="utf-8")
+            _json.write_file(out_path, fb, indent=True, fsync=True)
             return {
                 "ok": True,
                 "scope": scope,
@@ -572,7 +636,7 @@ def generate_rules_from_samples(
         return {"ok": False, "error": msg}
 
     out_path = _generated_rules_path(outputs_root, scope)
-    out_path.write_text(json.dumps(all_rules, ensure_ascii=False, indent=2), encoding="utf-8")
+    _json.write_file(out_path, all_rules, indent=True, fsync=True)
     return {
         "ok": True,
         "scope": scope,
@@ -602,6 +666,45 @@ def _strip_code_fence(s: str) -> str:
     return s.strip()
 
 
+_JSON_OPEN = "{["
+_JSON_SCAN_RE = re.compile(r'[{}\[\]"\\]')
+_JSON_OPENER_RE = re.compile(r"[{\[]")
+
+
+def _find_json_span(text: str, start: int = 0) -> Optional[Tuple[int, int]]:
+    """
+    Span (i, j) blok {...}/[...] seimbang pertama mulai dari `start`. Satu kali jalan
+    maju dengan stack posisi pembuka + status string/escape; tanpa backtracking regex.
+    Kalau pembuka terluar tidak pernah tertutup (mis. "[catatan {...}"), kembalikan
+    blok tertutup paling awal di dalamnya. None kalau tidak ada blok tertutup.
+    """
+    stack: List[int] = []
+    best: Optional[Tuple[int, int]] = None
+    in_str = False
+    skip = -1  # posisi karakter yang di-escape backslash (di dalam string)
+    # hanya karakter struktural yang dikunjungi; sisanya dilompati di level C
+    for m in _JSON_SCAN_RE.finditer(text, start):
+        ch = m.group()
+        if in_str:
+            if m.start() == skip:
+                continue
+            if ch == "\\":
+                skip = m.start() + 1
+            elif ch == '"':
+                in_str = False
+        elif ch in _JSON_OPEN:
+            stack.append(m.start())
+        elif ch == '"':
+            in_str = bool(stack)  # string di luar blok = prosa biasa
+        elif stack:  # } atau ]
+            o = stack.pop()
+            if not stack:
+                return o, m.end()
+            if best is None or o < best[0]:
+                best = (o, m.end())
+    return best
+
+
 def _json_loads_loose(s: Any) -> Any:
     if isinstance(s, (dict, list)):
         return s
@@ -611,12 +714,32 @@ def _json_loads_loose(s: Any) -> Any:
     try:
         return json.loads(text)
     except Exception:
-        m = re.search(r"(\{.*\}|\[.*\])", text, flags=re.DOTALL)
-        if m:
-            try:
-                return json.loads(m.group(1))
-            except Exception:
-                pass
+        pass
+    # blok top-level berurutan: tiap karakter dipindai sekali, tiap kandidat di-parse sekali
+    pos = 0
+    while (span := _find_json_span(text, pos)) is not None:
+        try:
+            return json.loads(text[span[0]:span[1]])
+        except Exception:
+            pos = span[1]
+    # terakhir: kandidat greedy lama (pembuka pertama s/d penutup sejenis terakhir),
+    # untuk output dengan tanda kutip liar yang mengacaukan pelacakan string
+    span = _greedy_json_span(text)
+    if span is not None:
+        try:
+            return json.loads(text[span[0]:span[1]])
+        except Exception:
+            pass
+    return None
+
+
+def _greedy_json_span(text: str) -> Optional[Tuple[int, int]]:
+    """Setara search(r"(\{.*\}|\[.*\])", DOTALL) tanpa regex: O(n), satu kandidat."""
+    last = {"{": text.rfind("}"), "[": text.rfind("]")}
+    for m in _JSON_OPENER_RE.finditer(text):
+        end = last[m.group()]
+        if end > m.start():
+            return m.start(), end + 1
     return None
 
 
@@ -716,23 +839,22 @@ LLM_SYSTEM_MSG = (
     "Keep answers in user's language. STRICT JSON ONLY."
 )
 
-_JSON_BLOCK_RE = re.compile(r"(\{(?:.|\n)*\}|\[(?:.|\n)*\])", re.MULTILINE)
-
-
 def _extract_first_json_block(s: str):
     s = (s or "").strip()
     try:
         return json.loads(s)
     except Exception:
-        m = _JSON_BLOCK_RE.search(s)
-        if not m:
+        cand = _greedy_json_span(s)
+        if cand is None:
             raise ValueError("No JSON block found")
-        cand = m.group(1)
-        for end in range(len(cand), 0, -1):
+        # prefix terpanjang kandidat yang valid = blok seimbang yang dimulai di pembukanya;
+        # cari ujungnya sekali jalan lalu parse sekali (bukan coba tiap panjang prefix)
+        span = _find_json_span(s, cand[0])
+        if span is not None and span[0] == cand[0]:
             try:
-                return json.loads(cand[:end])
+                return json.loads(s[span[0]:span[1]])
             except Exception:
-                continue
+                pass
         raise ValueError("Failed to parse JSON block")
 
 
@@ -745,9 +867,9 @@ def _ollama_json_router(prompt: str, model: str = DEFAULT_MODEL, temperature: fl
         "format": "json",
         "options": {"temperature": float(temperature)},
     }
-    r = requests.post(_get_llama_api(), json=payload, timeout=(5, timeout))
+    r = _SESSION.post(_get_llama_api(), json=payload, timeout=(5, timeout))
     r.raise_for_status()
-    data = r.json()
+    data = _json.loads(r.content)
     resp = data.get("response") or data.get("text") or data.get("output") or ""
     if isinstance(resp, (dict, list)):
         parsed = resp
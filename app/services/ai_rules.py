@@ -1,9 +1,14 @@
 # app/services/ai_rules.py
 from __future__ import annotations
 
-import json, re, random
+import itertools, re, random
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+from urllib.parse import urlparse
+
+from . import _json, _procpool
+from .ai_apply import compile_pattern
 
 LABELS = ("HIGH", "MEDIUM", "LOW", "INFO")
 
@@ -13,15 +18,13 @@ def _read_json(p: Path) -> dict:
     if not p.exists():
         return {}
     try:
-        return json.loads(p.read_text(encoding="utf-8"))
+        return _json.load_file(p)
     except Exception:
         return {}
 
 def _write_json_atomic(p: Path, data: dict) -> None:
     p.parent.mkdir(parents=True, exist_ok=True)
-    tmp = p.with_suffix(p.suffix + ".tmp")
-    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-    tmp.replace(p)
+    _json.write_file(p, data, indent=True, fsync=True)
 
 def _urls_txt(outputs_root: Path, scope: str) -> Path:
     return outputs_root / scope / "urls.txt"
@@ -43,37 +46,125 @@ def _ai_out_path(outputs_root: Path, scope: str) -> Path:
 
 # ---------- corpus loaders ----------
 
+def iter_url_lines(p: Path) -> Iterator[str]:
+    """
+    Baris non-kosong (strip), dibaca buffered; berhenti awal = sisa file tidak dibaca.
+    Bukan mmap: urls.txt bisa di-truncate/ditulis ulang collector saat iterasi (SIGBUS).
+    """
+    with p.open("rb") as f:
+        for raw in f:
+            # splitlines: \r / \r\n tetap dipisah seperti mode teks sebelumnya
+            for part in raw.splitlines():
+                s = part.decode("utf-8", "ignore").strip()
+                if s:
+                    yield s
+
 def load_urls(outputs_root: Path, scope: str, limit: Optional[int] = None) -> List[str]:
     p = _urls_txt(outputs_root, scope)
     if not p.exists():
         return []
-    out: List[str] = []
-    with p.open("r", encoding="utf-8", errors="ignore") as f:
-        for ln in f:
-            s = (ln or "").strip()
-            if not s:
-                continue
-            out.append(s)
-            if limit and len(out) >= limit:
-                break
-    return out
+    return list(itertools.islice(iter_url_lines(p), limit or None))
+
+def reservoir_sample_urls(p: Path, k: int) -> List[str]:
+    """
+    Sample acak k URL dari file dalam satu pass (Algorithm R): memori O(k),
+    bukan seluruh urls.txt. File dengan <= k baris dikembalikan utuh (diacak).
+    """
+    if k <= 0 or not p.exists():
+        return []
+    reservoir: List[str] = []
+    for n, line in enumerate(iter_url_lines(p), start=1):
+        if n <= k:
+            reservoir.append(line)
+        else:
+            j = random.randrange(n)
+            if j < k:
+                reservoir[j] = line
+    random.shuffle(reservoir)  # O(k): urutan acak seperti random.sample
+    return reservoir
 
 def load_enrich_map(outputs_root: Path, scope: str) -> Dict[str, Any]:
-    return _read_json(_url_enrich(outputs_root, scope)) or {}
+    """
+    url_enrich.json apa adanya (key persis); lookup per URL lewat `_enrich_rec`.
+    Di-memo per (path, mtime, size): preview/apply berulang tidak parse ulang file
+    besar selama belum berubah. Hasilnya dipakai bersama -- jangan dimutasi.
+    """
+    p = _url_enrich(outputs_root, scope)
+    return _load_enrich_cached(p, _file_sig(p))
+
+# kecil: satu entry bisa puluhan MB; versi lama (sig beda) cepat tergeser
+@lru_cache(maxsize=4)
+def _load_enrich_cached(p: Path, sig: tuple) -> Dict[str, Any]:
+    raw = _read_json(p)
+    return raw if isinstance(raw, dict) else {}
+
+def _enrich_rec(enrich_map: Dict[str, Any], url: str) -> Any:
+    # key persis dulu; variasi trailing "/" hanya fallback (record kosong dilewati)
+    return enrich_map.get(url) or enrich_map.get(url.rstrip("/")) or enrich_map.get(url + "/")
 
 # ---------- rules ----------
 
 def _compile_rule(r: dict) -> dict:
     rr = dict(r)
     pat = rr.get("pattern") or ".*"
-    rr["_re"] = re.compile(pat, re.IGNORECASE)
+    rr["_re"] = compile_pattern(pat)
     if isinstance(rr.get("method"), str):
         rr["method"] = [rr["method"]]
+    # invarian per rule dihitung sekali di sini, bukan per (url, rule) di _matches_rule
+    rr["_methods"] = frozenset(str(x).upper() for x in rr.get("method") or ())
+    rr["_host_lc"] = str(rr.get("host_contains") or "").lower()
+    rr["_path_lc"] = str(rr.get("path_contains") or "").lower()
+    codes = rr.get("code_in") or ()
+    try:
+        rr["_codes"] = frozenset(codes if isinstance(codes, (list, tuple, set, frozenset)) else (codes,))
+    except TypeError:
+        rr["_codes"] = frozenset()
     return rr
 
+def _file_sig(p: Path) -> Tuple[int, int]:
+    try:
+        st = p.stat()
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return (-1, -1)
+
 def load_rules(outputs_root: Path, scope: str) -> Tuple[str, List[dict]]:
-    seed = _read_json(_ai_seed_path(outputs_root, scope)).get("rules") or []
-    custom = _read_json(_ai_custom_path(outputs_root, scope)).get("rules") or []
+    """
+    Rules seed+custom ter-compile. Di-memo per (path, mtime, size) kedua file:
+    selama file tidak berubah, request berikutnya tidak baca/compile ulang.
+    """
+    version, compiled, _ = _load_rules_gated(outputs_root, scope)
+    return version, list(compiled)
+
+def _load_rules_gated(outputs_root: Path, scope: str) -> Tuple[str, Tuple[dict, ...], Optional[re.Pattern]]:
+    seed_p = _ai_seed_path(outputs_root, scope)
+    custom_p = _ai_custom_path(outputs_root, scope)
+    return _load_rules_cached(seed_p, _file_sig(seed_p), custom_p, _file_sig(custom_p))
+
+def _compile_gate(rules: Tuple[dict, ...]) -> Optional[re.Pattern]:
+    """
+    Satu alternation `(?P<r0>...)|(?P<r1>...)|...` dari semua pattern sebagai gate:
+    URL yang tidak cocok gabungan ini pasti tidak cocok rule mana pun, jadi cukup
+    satu scan regex per URL. Urutan first-match tetap ditentukan loop rules biasa
+    (posisi match paling kiri belum tentu rule pertama). None kalau ada pattern
+    ber-group (nomor backreference bergeser) atau gabungan gagal di-compile.
+    """
+    if not rules or any(r["_re"].groups for r in rules):
+        return None
+    try:
+        return re.compile(
+            "|".join(f"(?P<r{i}>{r['_re'].pattern})" for i, r in enumerate(rules)),
+            re.IGNORECASE,
+        )
+    except re.error:
+        return None
+
+@lru_cache(maxsize=32)
+def _load_rules_cached(
+    seed_p: Path, seed_sig: tuple, custom_p: Path, custom_sig: tuple
+) -> Tuple[str, Tuple[dict, ...], Optional[re.Pattern]]:
+    seed = _read_json(seed_p).get("rules") or []
+    custom = _read_json(custom_p).get("rules") or []
 
     merged: Dict[str, dict] = {}
     for r in seed:
@@ -83,50 +174,46 @@ def load_rules(outputs_root: Path, scope: str) -> Tuple[str, List[dict]]:
         if isinstance(r, dict) and r.get("id"):
             merged[r["id"]] = r
 
-    compiled = [_compile_rule(v) for v in merged.values()]
+    compiled = tuple(_compile_rule(v) for v in merged.values())
     version = "seed+custom" if custom else "seed"
-    return version, compiled
+    return version, compiled, _compile_gate(compiled)
 
 # ---------- matching ----------
 
-def _matches_rule(url: str, rec: Optional[dict], rule: dict) -> bool:
-    if not rule["_re"].search(url):
+def _matches_rule(url: str, rule: dict, host: str, path_lc: str, code_i: Optional[int], method_up: Optional[str]) -> bool:
+    # filter murah (set membership / substring) dulu; regex paling akhir
+    if rule["_codes"] and code_i not in rule["_codes"]:
+        return False
+    if rule["_methods"] and (method_up is None or method_up not in rule["_methods"]):
+        return False
+    if rule["_host_lc"] and rule["_host_lc"] not in host:
         return False
-    if rule.get("method"):
-        m = (rec or {}).get("mode") or (rec or {}).get("method")
-        if not m or str(m).upper() not in [x.upper() for x in rule["method"]]:
-            return False
-    if rule.get("host_contains"):
-        host = _safe_host(url)
-        if rule["host_contains"].lower() not in host.lower():
-            return False
-    if rule.get("path_contains"):
-        path = _safe_path(url)
-        if rule["path_contains"].lower() not in path.lower():
-            return False
-    if rule.get("code_in"):
-        code = (rec or {}).get("code")
-        try:
-            code_i = int(code) if code is not None else None
-        except Exception:
-            code_i = None
-        if code_i not in set(rule["code_in"]):
-            return False
-    return True
-
-def _safe_host(url: str) -> str:
+    if rule["_path_lc"] and rule["_path_lc"] not in path_lc:
+        return False
+    return rule["_re"].search(url) is not None
+
+def _rec_facts(rec: Optional[dict]) -> Tuple[Optional[int], Optional[str]]:
+    """(code int, method upper) dari record enrich; dihitung sekali per URL."""
+    if not rec:
+        return None, None
+    code = rec.get("code")
     try:
-        from urllib.parse import urlparse
-        return (urlparse(url).netloc or "").lower()
+        code_i = int(code) if code is not None else None
     except Exception:
-        return ""
+        code_i = None
+    m = rec.get("mode") or rec.get("method")
+    return code_i, (str(m).upper() if m else None)
 
-def _safe_path(url: str) -> str:
+def _needs_url_parts(rules) -> bool:
+    return any(r["_host_lc"] or r["_path_lc"] for r in rules)
+
+def _url_parts(url: str) -> Tuple[str, str]:
+    """(host, path) lowercase dari satu kali parse per URL, dipakai semua rule."""
     try:
-        from urllib.parse import urlparse
-        return (urlparse(url).path or "/")
+        u = urlparse(url)
+        return (u.netloc or "").lower(), (u.path or "/").lower()
     except Exception:
-        return "/"
+        return "", "/"
 
 def _demote_by_http(label: str, rec: Optional[dict], demote_blocked: bool, demote_404: bool) -> str:
     if not rec:
@@ -145,6 +232,51 @@ def _demote_by_http(label: str, rec: Optional[dict], demote_blocked: bool, demot
 
 # ---------- engine ----------
 
+# di bawah ini overhead spawn worker lebih mahal dari kerja regex-nya (sama dgn ai_apply)
+_PARALLEL_MIN_URLS = 20000
+_SHARD_SIZE = 4096
+
+# hasil shard berbentuk kolom (SoA): (final_labels, urls, rule_idx, codes) --
+# lebih ringkas dipickle dari worker daripada list tuple/dict per match
+_ShardMatches = Tuple[List[str], List[str], List[int], List[Any]]
+
+def _classify_shard(
+    urls: List[str],
+    recs: List[Optional[dict]],
+    rules: Tuple[dict, ...],
+    gate: Optional[re.Pattern],
+    demote_blocked: bool,
+    demote_404: bool,
+) -> _ShardMatches:
+    """
+    Klasifikasikan satu shard; tanpa state lintas URL, aman dijalankan di worker.
+    Match disimpan kolom-per-kolom (final_label, url, index rule, code), berurutan;
+    row dict dibuat di proses utama hanya untuk yang masuk sample.
+    """
+    gate_search = gate.search if gate is not None else None
+    needs_parts = _needs_url_parts(rules)
+    labels: List[str] = []
+    m_urls: List[str] = []
+    idxs: List[int] = []
+    codes: List[Any] = []
+    for url, rec in zip(urls, recs):
+        if gate_search is not None and gate_search(url) is None:
+            continue
+        host, path_lc = _url_parts(url) if needs_parts else ("", "/")
+        code_i, method_up = _rec_facts(rec)
+        for i, r in enumerate(rules):
+            if _matches_rule(url, r, host, path_lc, code_i, method_up):
+                label = str(r.get("label") or "INFO").upper()
+                if label not in LABELS:
+                    label = "INFO"
+                label = _demote_by_http(label, rec, demote_blocked, demote_404)
+                labels.append(label)
+                m_urls.append(url)
+                idxs.append(i)
+                codes.append((rec or {}).get("code"))
+                break
+    return labels, m_urls, idxs, codes
+
 def apply_rules(
     outputs_root: Path,
     scope: str,
@@ -153,36 +285,43 @@ def apply_rules(
     demote_404: bool = True,
     save_result: bool = True,
 ) -> dict:
-    rules_version, rules = load_rules(outputs_root, scope)
+    rules_version, rules, gate = _load_rules_gated(outputs_root, scope)
     urls = load_urls(outputs_root, scope, limit=None)
     enrich_map = load_enrich_map(outputs_root, scope)
+    recs = [_enrich_rec(enrich_map, u) for u in urls]
+    shards = [(urls[k:k + _SHARD_SIZE], recs[k:k + _SHARD_SIZE])
+              for k in range(0, len(urls), _SHARD_SIZE)]
 
     counts = {"HIGH": 0, "MEDIUM": 0, "LOW": 0, "INFO": 0}
-    results: List[dict] = []
+    # results tidak ditampung penuh: hanya sample seimbang yang ditulis ke output
+    sampler = _BalancedSampler(max_total=1000)
 
-    for url in urls:
-        rec = enrich_map.get(url) or enrich_map.get(url.rstrip("/")) or enrich_map.get(url + "/")
-        matched = None
-        for r in rules:
-            if _matches_rule(url, rec, r):
-                matched = r
-                break
-        if matched:
-            label = str(matched.get("label") or "INFO").upper()
-            if label not in LABELS:
-                label = "INFO"
-            label = _demote_by_http(label, rec, demote_blocked, demote_404)
+    def _emit(matches: _ShardMatches) -> None:
+        for label, url, i, code in zip(*matches):
             counts[label] = counts.get(label, 0) + 1
-            results.append({
-                "url": url,
-                "rule_id": matched.get("id") or "?",
-                "label": str(matched.get("label") or "INFO").upper(),
-                "reason": matched.get("reason") or "",
-                "final_label": label,
-                "code": (rec or {}).get("code"),
-            })
+            slot = sampler.slot(label)
+            if slot >= 0:
+                r = rules[i]
+                sampler.put(label, slot, {
+                    "url": url,
+                    "rule_id": r.get("id") or "?",
+                    "label": str(r.get("label") or "INFO").upper(),
+                    "reason": r.get("reason") or "",
+                    "final_label": label,
+                    "code": code,
+                })
+
+    if len(urls) >= _PARALLEL_MIN_URLS and rules:
+        # korpus besar: shard ke pool proses bersama (re tidak melepas GIL);
+        # shard di-emit berurutan supaya sampling deterministik
+        jobs = ((su, sr, rules, gate, demote_blocked, demote_404) for su, sr in shards)
+        for matches in _procpool.map_ordered(_classify_shard, jobs):
+            _emit(matches)
+    else:
+        for su, sr in shards:
+            _emit(_classify_shard(su, sr, rules, gate, demote_blocked, demote_404))
 
-    sample = _balanced_sample(results, max_total=1000)
+    sample = sampler.sample()
 
     out = {
         "summary": {
@@ -207,23 +346,26 @@ def preview_rules(
     demote_blocked: bool = True,
     demote_404: bool = True,
 ) -> dict:
-    rules_version, rules = load_rules(outputs_root, scope)
-    full = load_urls(outputs_root, scope, limit=None)
-    if not full:
+    rules_version, rules, gate = _load_rules_gated(outputs_root, scope)
+    # reservoir: tidak perlu memuat seluruh urls.txt hanya untuk ambil `limit` item
+    sample_urls = reservoir_sample_urls(_urls_txt(outputs_root, scope), max(1, limit))
+    if not sample_urls:
         return {"summary": {"rules_version": rules_version, "limit": 0, "counts": {}}}
 
-    rnd = list(full)
-    random.shuffle(rnd)
-    sample_urls = rnd[: max(1, min(limit, len(rnd)))]
-
     enrich_map = load_enrich_map(outputs_root, scope)
     per_rule: Dict[str, dict] = {}
     counts = {"HIGH": 0, "MEDIUM": 0, "LOW": 0, "INFO": 0}
 
+    gate_search = gate.search if gate is not None else None
+    needs_parts = _needs_url_parts(rules)
     for url in sample_urls:
-        rec = enrich_map.get(url) or enrich_map.get(url.rstrip("/")) or enrich_map.get(url + "/")
+        if gate_search is not None and gate_search(url) is None:
+            continue
+        rec = _enrich_rec(enrich_map, url)
+        host, path_lc = _url_parts(url) if needs_parts else ("", "/")
+        code_i, method_up = _rec_facts(rec)
         for r in rules:
-            if _matches_rule(url, rec, r):
+            if _matches_rule(url, r, host, path_lc, code_i, method_up):
                 label = str(r.get("label") or "INFO").upper()
                 final = _demote_by_http(label, rec, demote_blocked, demote_404)
                 rid = r.get("id") or "?"
@@ -251,20 +393,44 @@ def preview_rules(
 
 # ---------- utils ----------
 
-def _balanced_sample(rows: List[dict], max_total: int = 1000) -> List[dict]:
-    by_lbl: Dict[str, List[dict]] = {k: [] for k in LABELS}
-    for r in rows:
-        by_lbl.setdefault(r.get("final_label", "INFO"), []).append(r)
-
-    quotas = {
-        "HIGH": max_total // 10,
-        "MEDIUM": max_total // 3,
-        "LOW": max_total // 3,
-        "INFO": max_total - (max_total // 10) - (max_total // 3) * 2,
-    }
-
-    out: List[dict] = []
-    for k, lst in by_lbl.items():
-        random.shuffle(lst)
-        out.extend(lst[: quotas.get(k, 0)])
-    return out[:max_total]
+class _BalancedSampler:
+    """
+    Sample seimbang per label (kuota HIGH 10%, MEDIUM/LOW masing2 1/3, sisanya INFO)
+    secara streaming: reservoir per label (Algorithm R), memori O(max_total) dan
+    row dict hanya dibuat untuk URL yang masuk reservoir, bukan untuk semua match.
+    """
+
+    def __init__(self, max_total: int = 1000) -> None:
+        self.max_total = max_total
+        self.quotas = {
+            "HIGH": max_total // 10,
+            "MEDIUM": max_total // 3,
+            "LOW": max_total // 3,
+            "INFO": max_total - (max_total // 10) - (max_total // 3) * 2,
+        }
+        self.seen: Dict[str, int] = {k: 0 for k in LABELS}
+        self.rows: Dict[str, List[dict]] = {k: [] for k in LABELS}
+
+    def slot(self, label: str) -> int:
+        """Index reservoir yang harus diisi row ini, atau -1 kalau tidak terpilih."""
+        n = self.seen.get(label, 0) + 1
+        self.seen[label] = n
+        q = self.quotas.get(label, 0)
+        if n <= q:
+            return n - 1
+        j = random.randrange(n)
+        return j if j < q else -1
+
+    def put(self, label: str, idx: int, row: dict) -> None:
+        lst = self.rows.setdefault(label, [])
+        if idx == len(lst):
+            lst.append(row)
+        else:
+            lst[idx] = row
+
+    def sample(self) -> List[dict]:
+        out: List[dict] = []
+        for lst in self.rows.values():
+            random.shuffle(lst)
+            out.extend(lst)
+        return out[: self.max_total]
@@ -1,12 +1,25 @@
 from __future__ import annotations
 import asyncio
-import json
+import ipaddress
+import re
+import time
+from collections import OrderedDict
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional
 
 import httpx
 
+try:  # resolver async (c-ares) untuk pre-filter DNS opsional (dns_prefilter=True)
+    import aiodns
+    import pycares
+    if not hasattr(aiodns.DNSResolver, "getaddrinfo"):  # aiodns < 3.2
+        raise ImportError("aiodns>=3.2 required")
+except ImportError:  # pragma: no cover - tergantung environment
+    aiodns = None
+
+from . import _json
+
 CACHE_DIRNAME = "__cache"
 PROBE_FILE = "subdomains_probe.ndjson"
 STATE_FILE = "subdomains_probe.state.json"
@@ -29,18 +42,82 @@ def state_path(outputs_dir: Path, scope: str) -> Path:
 def lock_path(outputs_dir: Path, scope: str) -> Path:
     return _scope_cache(outputs_dir, scope) / LOCK_FILE
 
-def load_probe_map(outputs_dir: Path, scope: str) -> Dict[str, Dict[str, Any]]:
-    p = ndjson_path(outputs_dir, scope)
+# memo hasil parse per (jenis, path); valid selama (mtime_ns, size) file sama.
+# LRU kecil: tiap entry = map semua host satu scope
+_PROBE_CACHE: "OrderedDict[tuple[str, Path], tuple[tuple[int, int], Any]]" = OrderedDict()
+_PROBE_CACHE_MAX = 8
+
+def _memo_parse(kind: str, p: Path, parse: Callable[[Path], Any]) -> Any:
+    try:
+        st = p.stat()
+    except OSError:
+        _PROBE_CACHE.pop((kind, p), None)
+        return parse(p)
+    sig = (st.st_mtime_ns, st.st_size)
+    hit = _PROBE_CACHE.get((kind, p))
+    if hit is not None and hit[0] == sig:
+        _PROBE_CACHE.move_to_end((kind, p))
+        return hit[1]
+    data = parse(p)
+    _PROBE_CACHE[(kind, p)] = (sig, data)
+    _PROBE_CACHE.move_to_end((kind, p))
+    while len(_PROBE_CACHE) > _PROBE_CACHE_MAX:
+        _PROBE_CACHE.popitem(last=False)
+    return data
+
+class _CowMap(dict):
+    """
+    View milik caller atas map hasil memo. Dict luar disalin (murah, level C);
+    record baru di-copy saat pertama diakses, karena router menulis dekorasi
+    (is_oos, size_fmt, ...) ke record yang dikembalikan dan memo tidak boleh
+    ikut termutasi. Host yang tidak disentuh tidak pernah di-copy.
+    """
+    __slots__ = ("_own",)
+
+    def __init__(self, data: Dict[str, Any]):
+        super().__init__(data)
+        self._own: set = set()
+
+    def __getitem__(self, key):
+        rec = dict.__getitem__(self, key)
+        if key not in self._own:
+            self._own.add(key)
+            if isinstance(rec, dict):
+                rec = dict(rec)
+                dict.__setitem__(self, key, rec)
+        return rec
+
+    def __setitem__(self, key, value):
+        self._own.add(key)
+        dict.__setitem__(self, key, value)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def values(self):
+        return [self[k] for k in self]
+
+    def items(self):
+        return [(k, self[k]) for k in self]
+
+def _forget(p: Path) -> None:
+    for key in [k for k in _PROBE_CACHE if k[1] == p]:
+        _PROBE_CACHE.pop(key, None)
+
+def _parse_probe_map(p: Path) -> Dict[str, Dict[str, Any]]:
     result: Dict[str, Dict[str, Any]] = {}
-    if not p.exists():
-        return result
-    with p.open("r", encoding="utf-8", errors="ignore") as f:
+    with p.open("rb") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
             try:
-                rec = json.loads(line)
+                rec = _loads_line(line)
                 host = str(rec.get("host") or "").strip()
                 if host:
                     result[host] = rec
@@ -48,6 +125,12 @@ def load_probe_map(outputs_dir: Path, scope: str) -> Dict[str, Dict[str, Any]]:
                 continue
     return result
 
+def load_probe_map(outputs_dir: Path, scope: str) -> Dict[str, Dict[str, Any]]:
+    p = ndjson_path(outputs_dir, scope)
+    if not p.exists():
+        return {}
+    return _CowMap(_memo_parse("probe", p, _parse_probe_map))
+
 # helper kecil
 def _first_existing(*paths: Path) -> Path | None:
     for p in paths:
@@ -56,18 +139,25 @@ def _first_existing(*paths: Path) -> Path | None:
     return None
 
 def _load_json(path: Path) -> Any:
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return _json.load_file(path)
+
+def _loads_line(line: bytes) -> Any:
+    # bytes langsung ke parser (tanpa decode di Python); byte UTF-8 rusak
+    # dibuang seperti mode teks errors="ignore" sebelumnya
+    try:
+        return _json.loads(line)
+    except ValueError:
+        return _json.loads(line.decode("utf-8", "ignore"))
 
 def _load_ndjson(path: Path) -> list[dict]:
     out: list[dict] = []
-    with path.open("r", encoding="utf-8") as f:
+    with path.open("rb") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
             try:
-                out.append(json.loads(line))
+                out.append(_loads_line(line))
             except Exception:
                 pass
     return out
@@ -91,9 +181,9 @@ def get_probe_map_cached(outputs_dir: Path, scope: str) -> Dict[str, Dict[str, A
         base / "subdomains_enrich.json",  # fallback lama kalau ada
     )
     if enrich_path:
-        data = _load_json(enrich_path)
+        data = _memo_parse("enrich", enrich_path, _load_json)
         # pastikan dict[str, dict]
-        return data if isinstance(data, dict) else {}
+        return _CowMap(data) if isinstance(data, dict) else {}
 
     # 2) status map (varian nama)
     status_path = _first_existing(
@@ -102,18 +192,9 @@ def get_probe_map_cached(outputs_dir: Path, scope: str) -> Dict[str, Dict[str, A
         base / "__cache" / "subdomains_probe.state.json",
     )
     if status_path:
-        data = _load_json(status_path)
-        # normalisasi nama field bila perlu
-        # ekspektasi: {host: {alive, code, size, title, last_probe}}
+        data = _memo_parse("status", status_path, _parse_status_map)
         if isinstance(data, dict):
-            # beberapa generator menyimpan timestamp di field "ts" atau "time"
-            for rec in data.values():
-                if isinstance(rec, dict):
-                    if "last_probe" not in rec:
-                        ts = rec.get("ts") or rec.get("time") or rec.get("timestamp")
-                        if ts:
-                            rec["last_probe"] = ts
-            return data
+            return _CowMap(data)
 
     # 3) NDJSON (varian nama & folder)
     ndjson_path = _first_existing(
@@ -122,67 +203,154 @@ def get_probe_map_cached(outputs_dir: Path, scope: str) -> Dict[str, Dict[str, A
         base / "__cache" / "subdomain_probe.ndjson",  # <- yang kamu punya
     )
     if ndjson_path:
-        rows = _load_ndjson(ndjson_path)
-        agg: Dict[str, Dict[str, Any]] = {}
-        for r in rows:
-            host = r.get("host") or r.get("domain") or r.get("target")
-            if not host:
-                continue
-            # ambil data terakhir untuk host (ndjson biasanya streaming)
-            rec = agg.setdefault(host, {})
-            # map field umum
-            if "alive" in r:    rec["alive"] = bool(r["alive"])
-            if "code"  in r:    rec["code"]  = r["code"]
-            if "size"  in r:    rec["size"]  = r["size"]
-            if "title" in r:    rec["title"] = r["title"]
-            # timestamp varian
-            ts = r.get("last_probe") or r.get("ts") or r.get("time") or r.get("timestamp")
-            if ts:
-                rec["last_probe"] = ts
-        return agg
+        return _CowMap(_memo_parse("agg", ndjson_path, _parse_probe_agg))
 
     # fallback: kosong
     return {}
+
+def _parse_status_map(p: Path) -> Any:
+    data = _load_json(p)
+    # normalisasi nama field bila perlu
+    # ekspektasi: {host: {alive, code, size, title, last_probe}}
+    if isinstance(data, dict):
+        # beberapa generator menyimpan timestamp di field "ts" atau "time"
+        for rec in data.values():
+            if isinstance(rec, dict):
+                if "last_probe" not in rec:
+                    ts = rec.get("ts") or rec.get("time") or rec.get("timestamp")
+                    if ts:
+                        rec["last_probe"] = ts
+    return data
+
+def _parse_probe_agg(p: Path) -> Dict[str, Dict[str, Any]]:
+    rows = _load_ndjson(p)
+    agg: Dict[str, Dict[str, Any]] = {}
+    for r in rows:
+        host = r.get("host") or r.get("domain") or r.get("target")
+        if not host:
+            continue
+        # ambil data terakhir untuk host (ndjson biasanya streaming)
+        rec = agg.setdefault(host, {})
+        # map field umum
+        if "alive" in r:    rec["alive"] = bool(r["alive"])
+        if "code"  in r:    rec["code"]  = r["code"]
+        if "size"  in r:    rec["size"]  = r["size"]
+        if "title" in r:    rec["title"] = r["title"]
+        # timestamp varian
+        ts = r.get("last_probe") or r.get("ts") or r.get("time") or r.get("timestamp")
+        if ts:
+            rec["last_probe"] = ts
+    return agg
     
 def _write_state(p: Path, data: Dict[str, Any]) -> None:
-    p.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    p.write_bytes(_json.dumps(data))
+    _forget(p)
 
 def _read_state(p: Path) -> Dict[str, Any]:
     if not p.exists():
         return {"status": "idle"}
     try:
-        return json.loads(p.read_text(encoding="utf-8"))
+        return _json.loads(p.read_bytes())
     except Exception:
         return {"status": "unknown"}
 
-def _append_ndjson(p: Path, rec: Dict[str, Any]) -> None:
-    with p.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(rec, ensure_ascii=False) + "\n")
-
 # --- probing ---
 
 DEFAULT_TIMEOUT = 8.0
 DEFAULT_MAX_BODY = 16_384  # 16KB cukup untuk title
 DEFAULT_UA = "Pentest-Viewer/0.1 (+local)"
 
+# <title> sederhana (tanpa bs4); di-compile sekali, bukan per response.
+# Pola bytes: dicari langsung di potongan body, yang di-decode cuma isi title
+_TITLE_RE = re.compile(rb"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
 async def _fetch_title(client: httpx.AsyncClient, url: str) -> tuple[int|None, int|None, str|None]:
     try:
-        r = await client.get(url, timeout=DEFAULT_TIMEOUT, follow_redirects=True)
-        code = r.status_code
-        size = len(r.content or b"")
-        title = None
-        if r.headers.get("content-type","").lower().startswith("text/html"):
-            # cari <title> sederhana (tanpa bs4)
-            text = (r.text or "")[:DEFAULT_MAX_BODY]
-            import re
-            m = re.search(r"<title[^>]*>(.*?)</title>", text, re.IGNORECASE | re.DOTALL)
-            if m:
-                title = m.group(1).strip()
+        # stream: header dulu, body hanya dibaca seperlunya
+        async with client.stream("GET", url, timeout=DEFAULT_TIMEOUT, follow_redirects=True) as r:
+            code = r.status_code
+            is_html = r.headers.get("content-type", "").lower().startswith("text/html")
+            # size = panjang body (setelah decompress); Content-Length hanya valid
+            # kalau tidak ada Content-Encoding
+            clen = r.headers.get("content-length")
+            known = int(clen) if clen and clen.isdigit() and not r.headers.get("content-encoding") else None
+
+            head = b""
+            size = 0
+            if is_html or known is None:
+                async for chunk in r.aiter_bytes():
+                    if is_html and len(head) < DEFAULT_MAX_BODY:
+                        head += chunk[: DEFAULT_MAX_BODY - len(head)]
+                    size += len(chunk)
+                    if known is not None and len(head) >= DEFAULT_MAX_BODY:
+                        break  # size sudah dari header & title sudah dapat: sisa body tidak diunduh
+            if known is not None:
+                size = known
+
+            title = None
+            if is_html:
+                m = _TITLE_RE.search(head)
+                if m:
+                    title = m.group(1).decode(r.encoding or "utf-8", errors="replace").strip()
         return code, size, title
     except Exception:
         return None, None, None
 
-async def _probe_host(client: httpx.AsyncClient, host: str) -> Dict[str, Any]:
+# jawaban DNS yang pasti "tidak ada"; error lain (timeout, SERVFAIL, ...) tetap di-probe
+_DNS_MISSING = (
+    (pycares.errno.ARES_ENOTFOUND, pycares.errno.ARES_ENODATA) if aiodns is not None else ()
+)
+
+async def _resolve(resolver: Any, host: str) -> List[str] | None:
+    """
+    IP untuk host (lewat getaddrinfo c-ares, jadi /etc/hosts ikut dibaca).
+    Return [] kalau host pasti tidak resolve, None kalau tidak bisa dipastikan
+    (IP literal, host:port, timeout, ...).
+    """
+    try:
+        ipaddress.ip_address(host.strip("[]"))
+        return None
+    except ValueError:
+        pass
+    if ":" in host:
+        return None
+    try:
+        res = await resolver.getaddrinfo(host)
+    except aiodns.error.DNSError as e:
+        return [] if e.args and e.args[0] in _DNS_MISSING else None
+    except Exception:
+        return None
+    ips = []
+    for node in res.nodes:
+        ip = node.addr[0]
+        ips.append(ip.decode() if isinstance(ip, bytes) else ip)
+    return ips or None
+
+async def _probe_host(client: httpx.AsyncClient, host: str, resolver: Any = None) -> Dict[str, Any]:
+    if resolver is None:
+        return await _probe_http(client, host)
+    ips = await _resolve(resolver, host)
+    if ips == []:
+        # NXDOMAIN/NODATA: tidak perlu menunggu getaddrinfo + 2x connect
+        rec = _dead_record(host)
+    else:
+        rec = await _probe_http(client, host)
+    # "ip" hanya ada kalau pre-filter DNS aktif; format default tidak berubah
+    rec["ip"] = ips[0] if ips else None
+    return rec
+
+def _dead_record(host: str) -> Dict[str, Any]:
+    return {
+        "host": host,
+        "scheme": None,
+        "code": None,
+        "size": None,
+        "title": None,
+        "alive": False,
+        "checked_at": datetime.now(timezone.utc).isoformat()
+    }
+
+async def _probe_http(client: httpx.AsyncClient, host: str) -> Dict[str, Any]:
     # coba https dulu lalu http
     for scheme in ("https", "http"):
         url = f"{scheme}://{host}"
@@ -198,15 +366,21 @@ async def _probe_host(client: httpx.AsyncClient, host: str) -> Dict[str, Any]:
                 "checked_at": datetime.now(timezone.utc).isoformat()
             }
     # gagal kedua-duanya
-    return {
-        "host": host,
-        "scheme": None,
-        "code": None,
-        "size": None,
-        "title": None,
-        "alive": False,
-        "checked_at": datetime.now(timezone.utc).isoformat()
-    }
+    return _dead_record(host)
+
+_STATE_FLUSH_INTERVAL = 0.25  # detik
+
+def _make_client(concurrency: int) -> httpx.AsyncClient:
+    """Satu pool koneksi per run, ukurannya mengikuti jumlah worker (concurrency)."""
+    kw = dict(
+        headers={"User-Agent": DEFAULT_UA},
+        verify=False,
+        limits=httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency),
+    )
+    try:
+        return httpx.AsyncClient(http2=True, **kw)
+    except ImportError:  # paket h2 tidak ada -> HTTP/1.1 keep-alive
+        return httpx.AsyncClient(**kw)
 
 # task registry sederhana (di memory) agar bisa tahu sedang jalan
 _running_tasks: Dict[str, asyncio.Task] = {}
@@ -217,10 +391,14 @@ async def _run_probe(
     hosts: List[str],
     concurrency: int = 20,
     mode: str = "all",
+    dns_prefilter: bool = False,
 ) -> None:
     """
     Worker utama: mem-probe daftar host secara async, menulis hasil ke NDJSON
     dan progress ke state.json. Men-set last_* saat selesai sukses.
+    dns_prefilter=True (butuh aiodns): host yang NXDOMAIN menurut c-ares langsung
+    dicatat mati tanpa HTTP. Opt-in karena c-ares tidak ikut nsswitch (mdns, LDAP,
+    urutan /etc/hosts) dan salah kalau HTTP lewat proxy yang resolve sendiri.
     """
     sp = state_path(outputs_dir, scope)
     np = ndjson_path(outputs_dir, scope)
@@ -244,48 +422,67 @@ async def _run_probe(
 
     # reset cache untuk run baru
     np.unlink(missing_ok=True)
+    _forget(np)
     lp.write_text("lock", encoding="utf-8")
 
-    sem = asyncio.Semaphore(concurrency)
-
-    async with httpx.AsyncClient(headers={"User-Agent": DEFAULT_UA}, verify=False) as client:
-        async def worker(h: str):
-            nonlocal state
-            async with sem:
-                rec = await _probe_host(client, h)
-                _append_ndjson(np, rec)
-                state["done"] += 1
-                if rec.get("alive"):
-                    state["alive"] += 1
-                state["updated_at"] = datetime.now(timezone.utc).isoformat()
-                _write_state(sp, state)
+    last_flush = time.monotonic()
+
+    # satu handle NDJSON untuk seluruh run (bukan open/close per host); semua worker
+    # jalan di satu event loop dan write-nya sinkron, jadi baris tidak saling sisip
+    with np.open("ab", buffering=1 << 16) as out:
+        async with _make_client(concurrency) as client:
+            # pool worker tetap (= concurrency) yang menarik host dari satu iterator
+            # bersama, bukan satu task per host; aman karena semua jalan di satu event loop
+            pending = iter(hosts)
+            # opt-in: DNS di-resolve async (c-ares) sebelum HTTP; host yang pasti mati dilewati
+            resolver = (
+                aiodns.DNSResolver(timeout=3.0, tries=2)
+                if dns_prefilter and aiodns is not None else None
+            )
+
+            async def worker():
+                nonlocal state, last_flush
+                for h in pending:
+                    rec = await _probe_host(client, h, resolver)
+                    out.write(_json.dumps(rec) + b"\n")
+                    state["done"] += 1
+                    if rec.get("alive"):
+                        state["alive"] += 1
+                    state["updated_at"] = datetime.now(timezone.utc).isoformat()
+                    # progress di-flush maks ~4x/detik; state final selalu ditulis di finally
+                    now = time.monotonic()
+                    if now - last_flush >= _STATE_FLUSH_INTERVAL:
+                        last_flush = now
+                        out.flush()
+                        _write_state(sp, state)
 
-        try:
-            await asyncio.gather(*(worker(h) for h in hosts))
-            # sukses
-            state["status"] = "done"
-            state["updated_at"] = datetime.now(timezone.utc).isoformat()
-            # hitung durasi & set last_*
             try:
-                t0 = datetime.fromisoformat(state["started_at"])
-                t1 = datetime.fromisoformat(state["updated_at"])
-                dur_ms = int((t1 - t0).total_seconds() * 1000)
-            except Exception:
-                dur_ms = None
-            state["last_success_at"] = state["updated_at"]
-            state["last_mode"] = mode
-            state["last_total"] = state.get("total", 0)
-            state["last_alive"] = state.get("alive", 0)
-            state["last_duration_ms"] = dur_ms
-        except Exception as e:
-            # gagal (biarkan last_* dari run sukses sebelumnya tetap ada)
-            state["status"] = "error"
-            state["error"] = str(e)
-            state["updated_at"] = datetime.now(timezone.utc).isoformat()
-        finally:
-            _write_state(sp, state)
-            lp.unlink(missing_ok=True)
-            _running_tasks.pop(scope, None)
+                await asyncio.gather(*(worker() for _ in range(min(max(concurrency, 1), len(hosts)))))
+                # sukses
+                state["status"] = "done"
+                state["updated_at"] = datetime.now(timezone.utc).isoformat()
+                # hitung durasi & set last_*
+                try:
+                    t0 = datetime.fromisoformat(state["started_at"])
+                    t1 = datetime.fromisoformat(state["updated_at"])
+                    dur_ms = int((t1 - t0).total_seconds() * 1000)
+                except Exception:
+                    dur_ms = None
+                state["last_success_at"] = state["updated_at"]
+                state["last_mode"] = mode
+                state["last_total"] = state.get("total", 0)
+                state["last_alive"] = state.get("alive", 0)
+                state["last_duration_ms"] = dur_ms
+            except Exception as e:
+                # gagal (biarkan last_* dari run sukses sebelumnya tetap ada)
+                state["status"] = "error"
+                state["error"] = str(e)
+                state["updated_at"] = datetime.now(timezone.utc).isoformat()
+            finally:
+                out.flush()  # hasil lengkap di disk sebelum state final terlihat
+                _write_state(sp, state)
+                lp.unlink(missing_ok=True)
+                _running_tasks.pop(scope, None)
 
 def is_running(outputs_dir: Path, scope: str) -> bool:
     # kalau ada task in-memory atau ada lock file
@@ -302,6 +499,7 @@ def start_probe(
     hosts: Iterable[str],
     concurrency: int = 20,
     mode: str = "all",
+    dns_prefilter: bool = False,
 ) -> bool:
     """
     Mulai background probe. Return False jika sudah ada job berjalan
@@ -314,7 +512,8 @@ def start_probe(
         return False
 
     task = asyncio.create_task(
-        _run_probe(outputs_dir, scope, list(hosts), concurrency=concurrency, mode=mode)
+        _run_probe(outputs_dir, scope, list(hosts), concurrency=concurrency, mode=mode,
+                   dns_prefilter=dns_prefilter)
     )
     _running_tasks[scope] = task
     return True
@@ -2,11 +2,15 @@
 from __future__ import annotations
 
 import json
+import re
 import time
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Iterable, List, Tuple
 from urllib.parse import urlsplit, urlunsplit
 
+from . import _json
+
 CACHE_DIRNAME = "__cache"
 URL_ENRICH_NAME = "url_enrich.json"
 
@@ -16,6 +20,12 @@ _ENRICH_MTIME: Dict[Path, float] = {}
 
 
 # ---------- Canonicalization -------------------------------------------------
+# URL yang sudah kanonik: scheme & host lowercase, tanpa port/userinfo/fragment,
+# path ada dan tidak diakhiri "/" (kecuali "/"), query (kalau ada) tidak kosong.
+# Yang cocok dikembalikan apa adanya tanpa urlsplit/urlunsplit.
+_CANON_FAST_RE = re.compile(r"https?://[a-z0-9.\-]+(?:/|/[^?#\s]*[^?#\s/])(?:\?[^#\s]+)?")
+
+@lru_cache(maxsize=100_000)
 def canon_url(u: str) -> str:
     """
     Normalisasi URL agar key cocok antara CLI & UI:
@@ -26,6 +36,8 @@ def canon_url(u: str) -> str:
     - JANGAN buang query (penting untuk beberapa path)
     - hapus trailing slash kecuali "/"
     """
+    if _CANON_FAST_RE.fullmatch(u):
+        return u
     try:
         s = urlsplit(u.strip())
         scheme = (s.scheme or "http").lower()
@@ -42,6 +54,13 @@ def canon_url(u: str) -> str:
     except Exception:
         return u
 
+def dedupe_urls(lines: Iterable[str]) -> List[str]:
+    """Buang duplikat (termasuk yang beda host-case/trailing slash); urutan & ejaan pertama dijaga."""
+    seen: Dict[str, str] = {}
+    for ln in lines:
+        seen.setdefault(canon_url(ln), ln)
+    return list(seen.values())
+
 
 # ---------- Paths ------------------------------------------------------------
 def _cache_dir(outputs_dir: Path | str, scope: str) -> Path:
@@ -70,9 +89,8 @@ def _read_json_memo(p: Path) -> Dict[str, Any]:
 
 def save_enrich_map_atomic(path: Path, data: Dict[str, Any]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    tmp = path.with_suffix(path.suffix + ".tmp")
-    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
-    tmp.replace(path)
+    # orjson (via shim) langsung ke bytes; tmp + os.replace tetap atomik
+    _json.write_file(path, data)
     # refresh memo
     _ENRICH_CACHE[path] = data
     _ENRICH_MTIME[path] = path.stat().st_mtime
@@ -64,8 +64,11 @@ def python_exe() -> str:
 
 def merged_headers_from_settings(settings: dict | None) -> dict[str, str]:
     """Merge HTTP headers + user-agent policy from settings."""
-    s = _to_cfg(settings)
-    http = s.get("http", {}) or {}
+    return _merged_headers(_to_cfg(settings))
+
+def _merged_headers(cfg: Dict[str, Any]) -> dict[str, str]:
+    """Same as merged_headers_from_settings, for a cfg already passed through _to_cfg."""
+    http = cfg.get("http", {}) or {}
     out: dict[str, str] = {}
     for item in (http.get("headers") or []):
         k = (item.get("key") or "").strip()
@@ -84,23 +87,45 @@ def merged_headers_from_settings(settings: dict | None) -> dict[str, str]:
             out["User-Agent"] = "ReconLens/1.0 (+probe)"
     return out
 
+def _headers_args(cfg: Dict[str, Any]) -> list[str]:
+    """--headers-json/--ua args for the probe scripts (headers merged & serialized once)."""
+    headers_dict = _merged_headers(cfg)
+    return [
+        "--headers-json", json.dumps(headers_dict, ensure_ascii=False),
+        "--ua", headers_dict.get("User-Agent", "ReconLens/1.0 (+probe)"),
+    ]
+
 # ==========================================================
 # External binary resolver
 # ==========================================================
 
+# (tool, PATH) -> path found by a previous PATH scan; only hits are cached
+# (a tool installed later is still found) and each hit is re-checked on use
+_WHICH_CACHE: Dict[tuple[str, str], str] = {}
+
+def _is_exe(path: str) -> bool:
+    return os.path.isfile(path) and os.access(path, os.X_OK)
+
 def _which_with_path(tool: str, path_env: str) -> Optional[str]:
     """Try locating a binary using a custom PATH (used for Homebrew/Linux)."""
-    old = os.environ.get("PATH")
-    try:
-        os.environ["PATH"] = path_env
-        return shutil.which(tool)
-    finally:
-        if old is not None:
-            os.environ["PATH"] = old
+    key = (tool, path_env)
+    cached = _WHICH_CACHE.get(key)
+    if cached and _is_exe(cached):
+        return cached
+    # path= instead of swapping os.environ["PATH"] (not safe with concurrent jobs)
+    found = shutil.which(tool, path=path_env)
+    if found:
+        _WHICH_CACHE[key] = found
+    else:
+        _WHICH_CACHE.pop(key, None)
+    return found
 
 def resolve_external_binary(tool: str, settings: Optional[dict]) -> str:
     """Locate a binary either from settings, environment, or PATH."""
-    cfg = _to_cfg(settings)
+    return _resolve_binary(tool, _to_cfg(settings))
+
+def _resolve_binary(tool: str, cfg: Dict[str, Any]) -> str:
+    """resolve_external_binary for a cfg already passed through _to_cfg."""
     name = tool.lower()
 
     # 1. From settings.tools.<tool>.binary_path or settings.tools.<tool>_binary_path
@@ -130,7 +155,7 @@ def resolve_external_binary(tool: str, settings: Optional[dict]) -> str:
     if cand: return cand
 
     # 4. Fallback to current PATH
-    cand = shutil.which(name)
+    cand = _which_with_path(name, os.environ.get("PATH", os.defpath))
     if cand: return cand
 
     raise ValueError(f"Executable for '{name}' not found. Set via Settings or {env_key}.")
@@ -175,7 +200,7 @@ def build_tool_cmd(
 
     # --- URL collectors ---
     if tool == "gau":
-        exe = resolve_external_binary("gau", cfg)
+        exe = _resolve_binary("gau", cfg)
         cmd = [exe, "--verbose"]
         proxy_cfg = cfg.get("http", {}).get("proxy", {})
         if proxy_cfg.get("enabled") and proxy_cfg.get("url"):
@@ -184,7 +209,7 @@ def build_tool_cmd(
         return cmd
 
     if tool == "waymore":
-        exe = resolve_external_binary("waymore", cfg)
+        exe = _resolve_binary("waymore", cfg)
         
         # Build custom config with API keys from settings
         urlscan_api = cfg.get("tools", {}).get("urlscan_api", "").strip()
@@ -236,7 +261,7 @@ def build_tool_cmd(
         return [exe, "-i", scope, "-mode", "U", "-oU", str(out_dir / "urls.txt"), "-c", str(custom_config_path), "--verbose"]
 
     if tool == "urlfinder":
-        exe = resolve_external_binary("urlfinder", cfg)
+        exe = _resolve_binary("urlfinder", cfg)
         return [exe, "-d", scope, "-all", "-o", str(out_dir / "urls.txt")]
 
     # --- internal build module ---
@@ -255,7 +280,6 @@ def build_tool_cmd(
 
     # --- probing ---
     if tool == "probe_subdomains":
-        headers_dict = merged_headers_from_settings(cfg)
         script_py = Path(__file__).parent.parent.parent / "tools" / "probe_subdomains.py"
         return [
             py, str(script_py),
@@ -266,8 +290,7 @@ def build_tool_cmd(
             "--timeout", "8",
             "--prefer-https",
             "--if-head-then-get",
-            "--headers-json", json.dumps(headers_dict, ensure_ascii=False),
-            "--ua", headers_dict.get("User-Agent", "ReconLens/1.0 (+probe)"),
+            *_headers_args(cfg),
         ]
 
     if tool == "probe_module":
@@ -277,7 +300,7 @@ def build_tool_cmd(
         candidates = out_dir / f"{mod}_candidates.txt"
         fallback   = out_dir / f"{mod}.txt"
         input_file = candidates if candidates.exists() else fallback
-        headers_dict = merged_headers_from_settings(cfg)
+        headers_args = _headers_args(cfg)
         
         probe_sub_py = Path(__file__).parent.parent.parent / "tools" / "probe_subdomains.py"
         probe_urls_py = Path(__file__).parent.parent.parent / "tools" / "probe_urls.py"
@@ -292,8 +315,7 @@ def build_tool_cmd(
                 "--timeout", "8",
                 "--prefer-https",
                 "--if-head-then-get",
-                "--headers-json", json.dumps(headers_dict, ensure_ascii=False),
-                "--ua", headers_dict.get("User-Agent", "ReconLens/1.0 (+probe)"),
+                *headers_args,
             ]
         cmd = [
             py, str(probe_urls_py),
@@ -304,8 +326,7 @@ def build_tool_cmd(
             "--mode", probe_mode,
             "--concurrency", "8",
             "--timeout", "20",
-            "--headers-json", json.dumps(headers_dict, ensure_ascii=False),
-            "--ua", headers_dict.get("User-Agent", "ReconLens/1.0 (+probe)"),
+            *headers_args,
         ]
         if only_alive:
             cmd.append("--only-alive")
@@ -315,7 +336,7 @@ def build_tool_cmd(
     if tool == "dirsearch":
         if not host:
             raise ValueError("dirsearch requires host")
-        exe = resolve_external_binary("dirsearch", cfg)
+        exe = _resolve_binary("dirsearch", cfg)
         wl  = wordlists or "dicc.txt"
         from app.services.wordlists import get_wordlists_dir  # local import avoids cycle
         cmd = [
@@ -335,19 +356,19 @@ def build_tool_cmd(
 
     # --- passive subdomain collectors ---
     if tool == "subfinder":
-        exe = resolve_external_binary("subfinder", cfg)
+        exe = _resolve_binary("subfinder", cfg)
         return [exe, "-d", scope, "-all", "-silent"]
 
     if tool == "amass":
-        exe = resolve_external_binary("amass", cfg)
+        exe = _resolve_binary("amass", cfg)
         return [exe, "enum", "-passive", "-d", scope]
 
     if tool == "findomain":
-        exe = resolve_external_binary("findomain", cfg)
+        exe = _resolve_binary("findomain", cfg)
         return [exe, "--target", scope, "--quiet"]
 
     if tool == "nuclei_takeover":
-        exe = resolve_external_binary("nuclei", cfg)
+        exe = _resolve_binary("nuclei", cfg)
         return [
             exe,
             "-tags", "takeover",
@@ -357,7 +378,7 @@ def build_tool_cmd(
         ]
 
     if tool == "subzy_takeover":
-        exe = resolve_external_binary("subzy", cfg)
+        exe = _resolve_binary("subzy", cfg)
         return [
             exe,
             "run",
@@ -366,7 +387,7 @@ def build_tool_cmd(
         ]
 
     if tool == "subjack_takeover":
-        exe = resolve_external_binary("subjack", cfg)
+        exe = _resolve_binary("subjack", cfg)
         return [
             exe,
             "-w", str(out_dir / "subdomains.txt"),